@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Times the `utils.Git` entry points on generated repositories and prints the results as JSON, e.g.
+#
+#   $ python3 bench/benchmark.py --files 1000 100000 --branches 20000 --refs packed --diff-lines 50000 > before.json
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / 'src'
+sys.path.insert(0, str(SRC_DIR))
+
+import discovery
+import utils
+from diffparser import apply_diff_tags, parse_diff
+
+FILES_PER_DIR = 1000
+
+# Every n-th file gets modified, deleted or left untracked before measuring
+MODIFIED_EVERY = 100
+DELETED_EVERY = 250
+UNTRACKED_EVERY = 500
+
+
+class SpawnCounter:
+    def __init__(self):
+        self.count = 0
+        self.popen = subprocess.Popen
+
+    def __enter__(self):
+        counter = self
+
+        class CountingPopen(self.popen):
+            def __init__(self, *args, **kwargs):
+                counter.count += 1
+                super().__init__(*args, **kwargs)
+
+        subprocess.Popen = CountingPopen
+
+        return self
+
+    def __exit__(self, *_):
+        subprocess.Popen = self.popen
+
+
+def git(repo, *args, **kwargs):
+    return subprocess.run(['git', '-C', str(repo), *args],
+                          check=True,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL,
+                          **kwargs).stdout
+
+
+def generate_repo(path, files, branches, refs, diff_lines):
+    marker = path / '.bench-complete'
+    if marker.exists():
+        return
+
+    path.mkdir(parents=True, exist_ok=True)
+    git(path, 'init', '-q')
+    git(path, 'config', 'user.name', 'caja-git benchmark')
+    git(path, 'config', 'user.email', 'benchmark@localhost')
+
+    for i in range(files):
+        dirname = path / f'dir{i // FILES_PER_DIR:04d}'
+        if i % FILES_PER_DIR == 0:
+            dirname.mkdir(exist_ok=True)
+
+        (dirname / f'file{i:07d}.txt').write_text(f'file {i}\n')
+
+    (path / 'big.txt').write_text(''.join(f'line {i}\n' for i in range(diff_lines)))
+
+    git(path, 'add', '-A')
+    git(path, 'commit', '-q', '-m', 'Initial commit')
+
+    oid = git(path, 'rev-parse', 'HEAD').decode().strip()
+    updates = ''.join(f'create refs/heads/ci/build-{i:06d} {oid}\n' for i in range(branches))
+    git(path, 'update-ref', '--stdin', input=updates.encode())
+    if refs == 'packed':
+        git(path, 'pack-refs', '--all')
+
+    for i in range(files):
+        filename = path / f'dir{i // FILES_PER_DIR:04d}' / f'file{i:07d}.txt'
+        if i % DELETED_EVERY == 0:
+            filename.unlink()
+        elif i % MODIFIED_EVERY == 0:
+            filename.write_text(f'modified {i}\n')
+
+        if i % UNTRACKED_EVERY == 0:
+            filename.with_suffix('.new').write_text(f'untracked {i}\n')
+
+    (path / 'big.txt').write_text(''.join(f'changed line {i}\n' if i % 2 else f'line {i}\n' for i in range(diff_lines)))
+
+    marker.touch()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+
+    def at(q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    return {'p50': at(0.5), 'p90': at(0.9), 'p99': at(0.99), 'max': samples[-1], 'min': samples[0]}
+
+
+def measure(func, repeat, setup=None):
+    samples = []
+    with SpawnCounter() as counter:
+        for _ in range(repeat):
+            if setup is not None:
+                setup()
+
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+
+    return {'ms': percentiles(samples), 'spawns_per_call': counter.count / repeat}
+
+
+def make_text_buffer():
+    try:
+        import gi
+
+        gi.require_version('Gtk', '3.0')
+        from gi.repository import Gtk
+
+        buf = Gtk.TextBuffer.new(None)
+        for tag in ['added', 'chunk_header', 'deleted']:
+            buf.create_tag(tag)
+
+        return buf
+    except (ImportError, ValueError, RuntimeError):
+        return None
+
+
+def highlight(buf, text):
+    buf.set_text(text)
+    apply_diff_tags(buf, parse_diff(text))
+
+
+def bench_repo(path, repeat):
+    git_ = utils.acquire_git(str(path))
+    subdir = path / 'dir0000'
+    diff = git_.get_diff('big.txt', False)
+
+    results = {
+        'is_git_dir_cold': measure(lambda: utils.is_git_dir(str(subdir)), repeat, discovery._cache.clear),
+        'is_git_dir_warm': measure(lambda: utils.is_git_dir(str(subdir)), repeat),
+        'get_status': measure(git_.get_status, repeat, git_.invalidate),
+        'get_modified': measure(git_.get_modified, repeat, git_.invalidate),
+        'get_current_branch': measure(git_.get_current_branch, repeat),
+        'get_local_branches': measure(git_.get_local_branches, repeat),
+        'get_diff': measure(lambda: git_.get_diff('big.txt', False), repeat),
+        'parse_diff': measure(lambda: parse_diff(diff), repeat)
+    }
+
+    # Same work as GitDiffDialog.set_buffer() minus the streaming, on an offscreen buffer
+    if (buf := make_text_buffer()) is not None:
+        results['set_buffer'] = measure(lambda: highlight(buf, git_.get_diff('big.txt', False)), repeat)
+
+    utils.release_git(git_)
+
+    return results
+
+
+# Cumulative import time of `module` in a fresh interpreter, in milliseconds. The extension only imports `discovery`
+# when Caja starts, the git layer and the widgets are imported once a repository is shown.
+def measure_import(module, repeat):
+    samples = []
+    for _ in range(repeat):
+        stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=SRC_DIR,
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE).stderr.decode()
+        for line in stderr.splitlines():
+            *_, cumulative, name = line.split('|')
+            if name.strip() == module:
+                samples.append(int(cumulative) / 1000)
+
+    return {'ms': percentiles(samples)} if samples else None
+
+
+def get_revision():
+    try:
+        return git(SRC_DIR.parent, 'rev-parse', 'HEAD').decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the caja-git Git layer on generated repositories.')
+    parser.add_argument('--files', type=int, nargs='+', default=[1000, 10000], help='file counts to generate')
+    parser.add_argument('--branches', type=int, default=1000, help='number of local branches')
+    parser.add_argument('--refs', choices=['loose', 'packed'], default='loose', help='how branches are stored')
+    parser.add_argument('--diff-lines', type=int, default=10000, help='lines in the file used for diffs')
+    parser.add_argument('--repeat', type=int, default=20, help='measurements per entry point')
+    parser.add_argument('--work-dir', type=Path, help='keep generated repositories here and reuse them')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='caja-git-bench-') as tmp_dir:
+        work_dir = args.work_dir or Path(tmp_dir)
+
+        runs = []
+        for files in args.files:
+            path = work_dir / f'repo-{files}-{args.branches}-{args.refs}-{args.diff_lines}'
+            generate_repo(path, files, args.branches, args.refs, args.diff_lines)
+
+            runs.append({
+                'files': files,
+                'branches': args.branches,
+                'refs': args.refs,
+                'diff_lines': args.diff_lines,
+                'results': bench_repo(path, args.repeat),
+                'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            })
+
+    json.dump({
+        'revision': get_revision(),
+        'python': sys.version.split()[0],
+        'git': subprocess.run(['git', '--version'], stdout=subprocess.PIPE).stdout.decode().strip(),
+        'repeat': args.repeat,
+        'startup': {module: measure_import(module, args.repeat) for module in ['discovery', 'utils']},
+        'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'peak_children_rss_kib': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        'runs': runs
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: ft=python3 ts=4 et
@@ -0,0 +1,253 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+__all__ = ['GitConfig', 'read_config']
+
+import os
+import re
+from pathlib import Path
+
+from refs import read_head
+
+# Includes nested deeper than this are ignored, like git does
+MAX_INCLUDE_DEPTH = 10
+
+SECTION_RE = re.compile(r'\s*\[\s*([\w.-]+)\s*(?:"((?:[^"\\]|\\.)*)")?\s*\]')
+NAME_RE = re.compile(r'\s*([A-Za-z][\w-]*)\s*(=?)')
+
+UNESCAPE_RE = re.compile(r'\\(.)')
+
+# `**/` and `/**` match any number of directories, `*` and `?` stay within one
+GLOB_TOKEN_RE = re.compile(r'(\*\*/|/\*\*|\*|\?)')
+GLOB_TOKENS = {'**/': '(?:.*/)?', '/**': '(?:/.*)?', '*': '[^/]*', '?': '[^/]'}
+
+ESCAPES = {'\\': '\\', '"': '"', 'n': '\n', 't': '\t', 'b': '\b'}
+
+
+# 'Remote.origin.URL' -> 'remote.origin.url', the subsection is the only case-sensitive part
+def canonicalize_key(key):
+    section, _, rest = key.partition('.')
+    subsection, _, name = rest.rpartition('.')
+
+    return '.'.join(p for p in [section.lower(), subsection, name.lower()] if p)
+
+
+# Values of git config files, keys as printed by `git config --list`, the last value of a key wins
+class GitConfig:
+    def __init__(self, values, stamps):
+        self.values = values
+
+        # (path, mtime) of every file that was read or could have been, see `is_fresh()`
+        self.stamps = stamps
+
+    def get(self, key, default=None):
+        if values := self.values.get(canonicalize_key(key)):
+            return values[-1]
+
+        return default
+
+    def get_all(self, key):
+        return self.values.get(canonicalize_key(key), [])
+
+    # Yields (key, last value) of every key in `section`, e.g. 'caja-git'
+    def get_section(self, section):
+        prefix = f'{section.lower()}.'
+        for key, values in self.values.items():
+            if key.startswith(prefix):
+                yield key, values[-1]
+
+    def is_fresh(self):
+        return all(get_mtime(path) == mtime for path, mtime in self.stamps)
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def parse_value(line, lines):
+    value = []
+    quoted = False
+
+    # Whitespace outside of quotes is kept between words but not at either end
+    started = False
+    spaces = 0
+
+    i = 0
+    while i < len(line):
+        c = line[i]
+        i += 1
+
+        if not quoted and c.isspace():
+            spaces += started
+            continue
+
+        if not quoted and c in '#;':
+            break
+
+        value.append(' ' * spaces)
+        started = True
+        spaces = 0
+
+        if c == '\\':
+            if i >= len(line):
+                # A backslash at the end of the line continues the value on the next one
+                line, i = next(lines, ''), 0
+            else:
+                value.append(ESCAPES.get(line[i], line[i]))
+                i += 1
+        elif c == '"':
+            quoted = not quoted
+        else:
+            value.append(c)
+
+    return ''.join(value)
+
+
+def parse_config(text):
+    section = None
+    lines = iter(text.splitlines())
+    for line in lines:
+        while line.strip() and line.lstrip()[0] not in '#;':
+            if (match := SECTION_RE.match(line)) is not None:
+                name, subsection = match.groups()
+                if subsection is not None:
+                    subsection = UNESCAPE_RE.sub(r'\1', subsection)
+                    section = f'{name.lower()}.{subsection}'
+                else:
+                    # The deprecated [section.subsection] syntax, which is not case-sensitive
+                    section = name.lower()
+
+                # A variable may follow the header on the same line
+                line = line[match.end():]
+                continue
+
+            if section is not None and (match := NAME_RE.match(line)) is not None:
+                # A variable without '=' is a boolean true
+                value = parse_value(line[match.end():], lines) if match.group(2) else None
+                yield f'{section}.{match.group(1).lower()}', value
+
+            break
+
+
+def glob_to_re(pattern, ignore_case=False):
+    regex = ''
+    for token in GLOB_TOKEN_RE.split(pattern):
+        regex += GLOB_TOKENS.get(token, re.escape(token))
+
+    return re.compile(f'{regex}$', re.IGNORECASE if ignore_case else 0)
+
+
+# Whether an [includeIf "<condition>"] section applies, see the "Conditional includes" section of git-config(1)
+def is_include_active(condition, config_path, git_dir):
+    if git_dir is None:
+        return False
+
+    kind, _, pattern = condition.partition(':')
+
+    # A trailing slash matches everything below
+    if pattern.endswith('/'):
+        pattern += '**'
+
+    if kind in ('gitdir', 'gitdir/i'):
+        if pattern.startswith('./'):
+            pattern = os.path.join(os.path.dirname(config_path), pattern[2:])
+        elif pattern.startswith('~/'):
+            pattern = os.path.expanduser(pattern)
+        elif not pattern.startswith('/'):
+            pattern = f'**/{pattern}'
+
+        regex = glob_to_re(pattern, kind == 'gitdir/i')
+        return any(regex.match(d) is not None for d in [str(git_dir), os.path.realpath(git_dir)])
+
+    if kind == 'onbranch':
+        return (branch := read_head(git_dir)) is not None and glob_to_re(pattern).match(branch) is not None
+
+    return False
+
+
+def read_file(path, values, stamps, git_dir, depth=0):
+    stamps.append((path, get_mtime(path)))
+
+    try:
+        text = Path(path).read_text(encoding='utf-8', errors='surrogateescape')
+    except OSError:
+        return
+
+    for key, value in parse_config(text):
+        values.setdefault(key, []).append(value)
+
+        # Included files are read in place, so their values override the ones before the include
+        if key == 'include.path' or key.startswith('includeif.') and key.endswith('.path'):
+            if value is None or depth >= MAX_INCLUDE_DEPTH:
+                continue
+
+            condition = key[len('includeif.'):-len('.path')]
+            if condition.startswith('onbranch:') and git_dir is not None:
+                # Switching branches can change the configuration
+                head = os.path.join(git_dir, 'HEAD')
+                stamps.append((head, get_mtime(head)))
+
+            if key != 'include.path' and not is_include_active(condition, path, git_dir):
+                continue
+
+            include_path = os.path.expanduser(value)
+            if not os.path.isabs(include_path):
+                include_path = os.path.join(os.path.dirname(path), include_path)
+
+            read_file(include_path, values, stamps, git_dir, depth + 1)
+
+
+def get_global_config_files():
+    if (path := os.environ.get('GIT_CONFIG_GLOBAL')) is not None:
+        return [path]
+
+    xdg_config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser('~/.config')
+
+    return [os.path.join(xdg_config_home, 'git', 'config'), os.path.expanduser('~/.gitconfig')]
+
+
+def get_system_config_file():
+    if os.environ.get('GIT_CONFIG_NOSYSTEM', '').lower() in ('1', 'true', 'yes', 'on'):
+        return None
+
+    return os.environ.get('GIT_CONFIG_SYSTEM', '/etc/gitconfig')
+
+
+# Reads the system, global, repository and worktree configuration the way git layers them,
+# `git_dir` and `common_dir` are None outside of a repository
+def read_config(git_dir=None, common_dir=None):
+    values = {}
+    stamps = []
+
+    if (system_config := get_system_config_file()) is not None:
+        read_file(system_config, values, stamps, git_dir)
+
+    for path in get_global_config_files():
+        read_file(path, values, stamps, git_dir)
+
+    if common_dir is not None:
+        read_file(os.path.join(common_dir, 'config'), values, stamps, git_dir)
+
+        # Linked worktrees can override settings when extensions.worktreeConfig is on
+        if values.get('extensions.worktreeconfig', ['false'])[-1] in (None, 'true', 'yes', 'on', '1'):
+            read_file(os.path.join(git_dir, 'config.worktree'), values, stamps, git_dir)
+
+    return GitConfig(values, stamps)
+
+# vim: ft=python3 ts=4 et
@@ -0,0 +1,68 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+__all__ = ['DiffCache']
+
+from collections import OrderedDict
+from threading import Lock
+
+DIFF_CACHE_BYTES = 32 * 1024 * 1024
+
+
+# LRU of parsed diffs keyed by (path, staged, identity), bounded by the total size of the cached text
+class DiffCache:
+    def __init__(self, max_bytes=DIFF_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            if (entry := self.entries.get(key)) is None:
+                return None
+
+            self.entries.move_to_end(key)
+
+            return entry[1:]
+
+    def put(self, key, text, diff):
+        # The line model costs a byte per line on top of the text
+        size = len(text) + len(diff)
+        if key[2] is None or size > self.max_bytes:
+            return
+
+        with self.lock:
+            self.discard(key)
+
+            self.entries[key] = (size, text, diff)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                _, (evicted_size, *_) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def discard(self, key):
+        if (entry := self.entries.pop(key, None)) is not None:
+            self.size -= entry[0]
+
+    # Drops every entry for which `predicate(path, staged, identity)` is false
+    def retain(self, predicate):
+        with self.lock:
+            for key in [k for k in self.entries if not predicate(*k)]:
+                self.discard(key)
+
+# vim: ft=python3 ts=4 et
@@ -0,0 +1,143 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+__all__ = ['Diff', 'Hunk', 'LINE_ADDED', 'LINE_CONTEXT', 'LINE_DELETED', 'LINE_FILE_HEADER', 'LINE_HUNK_HEADER',
+           'LINE_NO_NEWLINE', 'apply_diff_tags', 'parse_diff', 'split_lines']
+
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from itertools import groupby
+
+LINE_FILE_HEADER = 0
+LINE_HUNK_HEADER = 1
+LINE_CONTEXT = 2
+LINE_ADDED = 3
+LINE_DELETED = 4
+LINE_NO_NEWLINE = 5
+
+# Also matches the `@@@ ... @@@` headers of combined diffs shown for conflicted files
+HUNK_HEADER_RE = re.compile(r'^(@@+) -(\d+)(?:,(\d+))? .*?\+(\d+)(?:,(\d+))? @@+')
+
+# The line breaks Gtk.TextBuffer recognizes, so line numbers match the buffer
+LINE_BREAK_RE = re.compile('\r\n|[\r\n\u2029]')
+
+# Text tags the diff dialog creates for each highlighted line kind
+DIFF_TAGS = {
+    LINE_ADDED: 'added',
+    LINE_DELETED: 'deleted',
+    LINE_HUNK_HEADER: 'chunk_header'
+}
+
+Hunk = namedtuple('Hunk', ['line_nr', 'old_start', 'old_count', 'new_start', 'new_count'])
+
+
+# Incremental unified diff parser, `feed()` takes lines without their line endings
+class Diff:
+    def __init__(self):
+        self.kinds = array('B')
+        self.hunks = []
+        self.hunk_lines = []
+        self.added = 0
+        self.deleted = 0
+
+        # Number of prefix columns of the current hunk, 0 outside of a hunk
+        self.columns = 0
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def classify(self, line):
+        # Hunks end at the next file or hunk header, anything else in between is hunk content
+        if self.columns and not line.startswith(('diff ', '@@')):
+            if line.startswith('\\'):
+                return LINE_NO_NEWLINE
+
+            prefix = line[:self.columns]
+            if '-' in prefix:
+                self.deleted += 1
+                return LINE_DELETED
+
+            if '+' in prefix:
+                self.added += 1
+                return LINE_ADDED
+
+            return LINE_CONTEXT
+
+        self.columns = 0
+
+        if (match := HUNK_HEADER_RE.match(line)) is not None:
+            self.columns = len(match.group(1)) - 1
+            self.hunks.append(Hunk(len(self.kinds),
+                                   int(match.group(2)),
+                                   int(match.group(3) or 1),
+                                   int(match.group(4)),
+                                   int(match.group(5) or 1)))
+            self.hunk_lines.append(len(self.kinds))
+
+            return LINE_HUNK_HEADER
+
+        return LINE_FILE_HEADER
+
+    def feed(self, lines):
+        self.kinds.extend(self.classify(line) for line in lines)
+
+    # Yields (kind, first line, end line) for runs of lines with the same kind
+    def ranges(self, start=0, end=None):
+        line_nr = start
+        for kind, run in groupby(self.kinds[start:end]):
+            count = sum(1 for _ in run)
+            yield kind, line_nr, line_nr + count
+
+            line_nr += count
+
+    def next_hunk(self, line_nr):
+        if (i := bisect_right(self.hunk_lines, line_nr)) < len(self.hunks):
+            return self.hunks[i]
+
+        return None
+
+    def prev_hunk(self, line_nr):
+        if (i := bisect_left(self.hunk_lines, line_nr)) > 0:
+            return self.hunks[i - 1]
+
+        return None
+
+
+def split_lines(text):
+    lines = LINE_BREAK_RE.split(text)
+    if not lines[-1]:
+        lines.pop()
+
+    return lines
+
+
+def parse_diff(text):
+    diff = Diff()
+    diff.feed(split_lines(text))
+
+    return diff
+
+
+# Tags lines `start` to `end` of `diff`, which must already be in the Gtk.TextBuffer `buf`,
+# one contiguous range at a time
+def apply_diff_tags(buf, diff, start=0, end=None):
+    for kind, first, last in diff.ranges(start, end):
+        if (tag := DIFF_TAGS.get(kind)) is not None:
+            buf.apply_tag_by_name(tag, buf.get_iter_at_line(first), buf.get_iter_at_line(last))
+
+# vim: ft=python3 ts=4 et
@@ -0,0 +1,141 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+__all__ = ['Repository', 'find_repository']
+
+import os
+from collections import OrderedDict, namedtuple
+from threading import Lock
+
+DISCOVERY_CACHE_SIZE = 4096
+
+Repository = namedtuple('Repository', ['top_level_dir', 'git_dir'])
+
+# path -> (mtimes of every directory looked at, Repository or None)
+_cache = OrderedDict()
+_cache_lock = Lock()
+
+
+def get_ceiling_dirs():
+    ceiling_dirs = os.environ.get('GIT_CEILING_DIRECTORIES', '').split(os.pathsep)
+
+    return {os.path.realpath(d) for d in ceiling_dirs if os.path.isabs(d)}
+
+
+def is_valid_git_dir(path):
+    if not os.path.isfile(os.path.join(path, 'HEAD')):
+        return False
+
+    # Linked worktrees keep their objects in the common directory
+    return os.path.isdir(os.path.join(path, 'objects')) or os.path.isfile(os.path.join(path, 'commondir'))
+
+
+def read_gitdir_file(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            line = f.readline().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+    if not line.startswith('gitdir:'):
+        return None
+
+    return os.path.realpath(os.path.join(os.path.dirname(path), line[len('gitdir:'):].strip()))
+
+
+def get_git_dir(path):
+    dot_git = os.path.join(path, '.git')
+    if os.path.isdir(dot_git):
+        git_dir = dot_git
+    elif os.path.isfile(dot_git):
+        # Submodules and linked worktrees use a `gitdir: <path>` file
+        if (git_dir := read_gitdir_file(dot_git)) is None:
+            return None
+    else:
+        return None
+
+    return git_dir if is_valid_git_dir(git_dir) else None
+
+
+# Walks up from `path` the same way `git rev-parse --show-toplevel` does, stopping at
+# GIT_CEILING_DIRECTORIES and filesystem boundaries
+def discover(path):
+    stamps = []
+
+    # Like git, directories inside the git directory are not part of the work tree
+    if '.git' in path.split(os.sep):
+        return stamps, None
+
+    ceiling_dirs = get_ceiling_dirs()
+    across_filesystems = os.environ.get('GIT_DISCOVERY_ACROSS_FILESYSTEM', '').lower() in ('1', 'true', 'yes', 'on')
+
+    dirname = path
+    device = None
+    while True:
+        try:
+            st = os.stat(dirname)
+        except OSError:
+            break
+
+        if device is None:
+            device = st.st_dev
+        elif st.st_dev != device and not across_filesystems:
+            break
+
+        stamps.append((dirname, st.st_mtime_ns))
+
+        if (git_dir := get_git_dir(dirname)) is not None:
+            return stamps, Repository(dirname, git_dir)
+
+        parent = os.path.dirname(dirname)
+        if parent == dirname or parent in ceiling_dirs:
+            break
+
+        dirname = parent
+
+    return stamps, None
+
+
+def is_fresh(stamps):
+    for dirname, mtime in stamps:
+        try:
+            if os.stat(dirname).st_mtime_ns != mtime:
+                return False
+        except OSError:
+            return False
+
+    return bool(stamps)
+
+
+def find_repository(path):
+    path = os.path.realpath(path)
+
+    with _cache_lock:
+        if (cached := _cache.get(path)) is not None and is_fresh(cached[0]):
+            _cache.move_to_end(path)
+            return cached[1]
+
+    stamps, repository = discover(path)
+
+    with _cache_lock:
+        _cache[path] = (stamps, repository)
+        _cache.move_to_end(path)
+        if len(_cache) > DISCOVERY_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return repository
+
+# vim: ft=python3 ts=4 et
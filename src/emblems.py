@@ -0,0 +1,129 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+__all__ = ['update_file_info']
+
+from collections import OrderedDict
+
+import gi
+
+gi.require_version('Gio', '2.0')
+from gi.repository import Gio
+
+from statusindex import STATE_CONFLICTED, STATE_MODIFIED, STATE_STAGED, STATE_UNTRACKED, StatusIndex, get_states
+from utils import acquire_git, release_git, run_async
+
+EMBLEMS = {
+    STATE_CONFLICTED: 'emblem-important',
+    STATE_MODIFIED: 'emblem-synchronizing',
+    STATE_STAGED: 'emblem-default',
+    STATE_UNTRACKED: 'emblem-new'
+}
+
+# Repositories with emblems kept up to date, the least recently browsed one is dropped beyond that
+EMBLEM_REPOSITORIES = 16
+
+# Files of a repository whose emblems are kept up to date, the least recently shown ones are forgotten beyond that
+EMBLEM_FILES = 8192
+
+# top-level directory -> RepositoryEmblems
+_repositories = OrderedDict()
+
+
+class RepositoryEmblems:
+    def __init__(self, git):
+        self.git = git
+        self.index = None
+        self.cancellable = None
+
+        # Relative path -> Caja.FileInfo of the files Caja asked about, so they can be invalidated when they change
+        self.files = OrderedDict()
+
+        self.refresh_handler = self.git.connect('refresh', lambda _: self.refresh())
+        self.refresh()
+
+        # Emblems are shown without an info bar, so the repository is watched for as long as they are kept
+        self.git.resume()
+
+    def release(self):
+        self.git.suspend()
+
+        self.cancellable.cancel()
+        self.git.disconnect(self.refresh_handler)
+        release_git(self.git)
+
+    def refresh(self):
+        if self.cancellable is not None:
+            self.cancellable.cancel()
+
+        self.cancellable = Gio.Cancellable.new()
+        run_async(lambda c: get_states(self.git.get_snapshot(c)), self.update, self.cancellable)
+
+    def update(self, states):
+        # The emblems shown so far are kept if git could not be run
+        if states is None:
+            return
+
+        if self.index is None:
+            self.index = StatusIndex()
+            self.index.update(states)
+
+            # Everything asked for before the index existed has no emblem yet
+            changed = set(self.files)
+        else:
+            changed = self.index.update(states)
+
+        for path in changed:
+            if path.endswith('/'):
+                # An untracked directory appeared or disappeared, so did the state of everything inside it
+                changed_files = [p for p in self.files if p.startswith(path)]
+            else:
+                changed_files = [path] if path in self.files else []
+
+            for path_ in changed_files:
+                self.files.pop(path_).invalidate_extension_info()
+
+    def update_file_info(self, file, path):
+        self.files[path] = file
+        self.files.move_to_end(path)
+
+        # Caja asks again about files it shows, so the ones forgotten are no longer on screen
+        if len(self.files) > EMBLEM_FILES:
+            self.files.popitem(last=False)
+
+        if self.index is not None and (state := self.index.get(path)) is not None:
+            file.add_emblem(EMBLEMS[state])
+
+
+# `repository` is the one `dirname`, the resolved directory containing `file`, belongs to
+def update_file_info(file, dirname, repository):
+    top_level_dir = repository.top_level_dir
+    if (emblems := _repositories.get(top_level_dir)) is None:
+        emblems = _repositories[top_level_dir] = RepositoryEmblems(acquire_git(top_level_dir))
+
+        if len(_repositories) > EMBLEM_REPOSITORIES:
+            _repositories.popitem(last=False)[1].release()
+    else:
+        _repositories.move_to_end(top_level_dir)
+
+    if dirname == top_level_dir:
+        path = file.get_name()
+    else:
+        path = f'{dirname[len(top_level_dir) + 1:]}/{file.get_name()}'
+
+    emblems.update_file_info(file, path)
+
+# vim: ft=python3 ts=4 et
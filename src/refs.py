@@ -0,0 +1,135 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+__all__ = ['BranchIndex', 'get_common_dir', 'read_head', 'read_local_branches', 'uses_reftable']
+
+import os
+from bisect import bisect_left
+from pathlib import Path
+from threading import Lock
+
+HEADS_PREFIX = 'refs/heads/'
+
+# packed-refs path -> ((mtime, size, inode), {refname: oid})
+_packed_refs_cache = {}
+_packed_refs_lock = Lock()
+
+
+def get_common_dir(git_dir):
+    git_dir = Path(git_dir)
+
+    try:
+        commondir = (git_dir / 'commondir').read_text(encoding='utf-8').strip()
+    except OSError:
+        return git_dir
+
+    return Path(os.path.realpath(git_dir / commondir))
+
+
+# Repositories using the reftable backend have neither loose refs nor packed-refs,
+# callers fall back to asking git
+def uses_reftable(common_dir):
+    return Path(common_dir, 'reftable').is_dir()
+
+
+def read_head(git_dir):
+    try:
+        head = Path(git_dir, 'HEAD').read_text(encoding='utf-8').strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+    if head.startswith('ref:'):
+        ref = head[len('ref:'):].strip()
+
+        return ref[len(HEADS_PREFIX):] if ref.startswith(HEADS_PREFIX) else ref
+
+    return head or None
+
+
+def parse_packed_refs(text):
+    refs = {}
+    for line in text.splitlines():
+        # Skip the header and peeled tag values
+        if not line or line[0] in '#^':
+            continue
+
+        oid, _, refname = line.partition(' ')
+        refs[refname] = oid
+
+    return refs
+
+
+def read_packed_refs(common_dir):
+    path = Path(common_dir, 'packed-refs')
+
+    try:
+        st = path.stat()
+    except OSError:
+        return {}
+
+    stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    with _packed_refs_lock:
+        if (cached := _packed_refs_cache.get(path)) is not None and cached[0] == stamp:
+            return cached[1]
+
+    try:
+        refs = parse_packed_refs(path.read_text(encoding='utf-8', errors='surrogateescape'))
+    except OSError:
+        return {}
+
+    with _packed_refs_lock:
+        _packed_refs_cache[path] = (stamp, refs)
+
+    return refs
+
+
+def read_local_branches(common_dir):
+    branches = {r[len(HEADS_PREFIX):] for r in read_packed_refs(common_dir) if r.startswith(HEADS_PREFIX)}
+
+    heads_dir = Path(common_dir, HEADS_PREFIX)
+    for dirname, _, files in os.walk(heads_dir):
+        prefix = Path(dirname).relative_to(heads_dir)
+        branches.update(prefix.joinpath(f).as_posix() for f in files if not f.endswith('.lock'))
+
+    return sorted(branches)
+
+
+# Sorted branch names with O(log n) membership and prefix lookups
+class BranchIndex:
+    def __init__(self, branches):
+        self.branches = sorted(branches)
+
+    def __contains__(self, branch):
+        i = bisect_left(self.branches, branch)
+
+        return i < len(self.branches) and self.branches[i] == branch
+
+    def __iter__(self):
+        return iter(self.branches)
+
+    def __len__(self):
+        return len(self.branches)
+
+    def complete(self, prefix, limit=None):
+        start = bisect_left(self.branches, prefix)
+        end = bisect_left(self.branches, prefix + chr(0x10FFFF), lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+
+        return self.branches[start:end]
+
+# vim: ft=python3 ts=4 et
@@ -0,0 +1,92 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+__all__ = ['get_project_name', 'get_remote_url', 'get_web_url', 'rewrite_url']
+
+import re
+from urllib.parse import urlsplit
+
+# [user@]host:path, git only treats it as scp-like if there is no slash before the colon
+SCP_LIKE_URL_RE = re.compile(r'^(?:[^@/]+@)?([^:/]+):(?!//)(.+)$')
+
+WEB_URL_SCHEMES = ('git', 'git+ssh', 'http', 'https', 'ssh', 'ssh+git')
+
+
+# Applies the url.<base>.insteadOf rules of `config`, the longest matching prefix wins
+def rewrite_url(url, config):
+    best = None
+    for key, _ in config.get_section('url'):
+        if not key.endswith('.insteadof'):
+            continue
+
+        base = key[len('url.'):-len('.insteadof')]
+        for prefix in config.get_all(key):
+            if prefix and url.startswith(prefix) and (best is None or len(prefix) > len(best[1])):
+                best = (base, prefix)
+
+    if best is None:
+        return url
+
+    return best[0] + url[len(best[1]):]
+
+
+# Turns a clone URL into the https:// URL of the project page, None for local paths and unknown schemes
+def get_web_url(url):
+    if '://' not in url:
+        if (match := SCP_LIKE_URL_RE.match(url)) is None:
+            return None
+
+        host, path = match.groups()
+    else:
+        parts = urlsplit(url)
+        if parts.scheme.lower() not in WEB_URL_SCHEMES or not parts.hostname:
+            return None
+
+        # Drop credentials and ports, ssh:// ports are not where the web interface is
+        host = parts.hostname
+        if parts.scheme.lower() in ('http', 'https') and parts.port is not None:
+            host = f'{host}:{parts.port}'
+
+        path = parts.path
+
+    path = path.strip('/')
+    if path.endswith('.git'):
+        path = path[:-len('.git')]
+
+    if not path:
+        return None
+
+    return f'https://{host}/{path}'
+
+
+# The URL of the 'origin' remote or, if there is no such remote, of the only one there is
+def get_remote_url(config):
+    if (url := config.get('remote.origin.url')) is None:
+        urls = [url for key, url in config.get_section('remote') if key.endswith('.url')]
+        if len(urls) != 1:
+            return None
+
+        url = urls[0]
+
+    return rewrite_url(url, config) if url else None
+
+
+def get_project_name(url):
+    name = url.rstrip('/').rsplit('/', 1)[-1].rsplit(':', 1)[-1]
+
+    return name[:-len('.git')] if name.endswith('.git') else name or None
+
+# vim: ft=python3 ts=4 et
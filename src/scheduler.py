@@ -0,0 +1,119 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+__all__ = ['RefreshScheduler']
+
+from pathlib import Path
+
+import gi
+
+gi.require_version('GLib', '2.0')
+from gi.repository import GLib, GObject
+
+# Refreshes are at least this far apart
+REFRESH_MIN_INTERVAL_MS = 1000
+
+# While a lock file exists git is in the middle of writing, check again this often
+REFRESH_LOCK_POLL_MS = 250
+
+# During a rebase, merge, cherry-pick or revert wait until nothing has changed for this long, so a sequence of
+# commits is shown once but an operation stopped on a conflict still is
+REFRESH_SETTLE_MS = 1500
+
+# Continuous activity still refreshes this often
+REFRESH_MAX_DEFER_MS = 10000
+
+LOCK_FILES = ('HEAD.lock', 'index.lock')
+COMMON_LOCK_FILES = ('packed-refs.lock',)
+OPERATION_MARKERS = ('CHERRY_PICK_HEAD', 'MERGE_HEAD', 'REVERT_HEAD', 'rebase-apply', 'rebase-merge', 'sequencer')
+
+
+def get_time_ms():
+    return GLib.get_monotonic_time() // 1000
+
+
+# Turns bursts of `request()` calls into single 'refresh' emissions
+class RefreshScheduler(GObject.GObject):
+    __gsignals__ = {'refresh': (GObject.SIGNAL_RUN_FIRST, None, ())}
+
+    def __init__(self, git_dir, common_dir=None):
+        super().__init__()
+
+        self.git_dir = Path(git_dir)
+        self.common_dir = self.git_dir if common_dir is None else Path(common_dir)
+
+        self.timeout_id = 0
+        self.first_request = None
+        self.last_request = None
+        self.last_refresh = None
+
+    def stop(self):
+        if self.timeout_id:
+            GLib.source_remove(self.timeout_id)
+            self.timeout_id = 0
+
+        self.first_request = None
+
+    def request(self):
+        now = get_time_ms()
+        if self.first_request is None:
+            self.first_request = now
+
+        self.last_request = now
+
+        if not self.timeout_id:
+            self.schedule(self.get_delay(now))
+
+    def schedule(self, delay):
+        self.timeout_id = GLib.timeout_add(max(delay, 0), self.timeout)
+
+    def is_locked(self):
+        return any((self.git_dir / name).exists() for name in LOCK_FILES) \
+            or any((self.common_dir / name).exists() for name in COMMON_LOCK_FILES)
+
+    def is_operation_in_progress(self):
+        return any((self.git_dir / name).exists() for name in OPERATION_MARKERS)
+
+    # Milliseconds until a refresh may run, 0 if it may run now
+    def get_delay(self, now):
+        delay = 0
+        if self.last_refresh is not None:
+            delay = self.last_refresh + REFRESH_MIN_INTERVAL_MS - now
+
+        if now - self.first_request < REFRESH_MAX_DEFER_MS:
+            if self.is_locked():
+                delay = max(delay, REFRESH_LOCK_POLL_MS)
+            elif self.is_operation_in_progress():
+                delay = max(delay, self.last_request + REFRESH_SETTLE_MS - now)
+
+        return delay
+
+    def timeout(self):
+        self.timeout_id = 0
+
+        now = get_time_ms()
+        if (delay := self.get_delay(now)) > 0:
+            self.schedule(delay)
+            return False
+
+        self.first_request = None
+        self.last_refresh = now
+
+        self.emit('refresh')
+
+        return False
+
+# vim: ft=python3 ts=4 et
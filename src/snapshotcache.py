@@ -0,0 +1,164 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+# Status snapshots kept across sessions in $XDG_CACHE_HOME/caja-git, so a repository can be shown before git status
+# has run. A snapshot is only used while HEAD, the current branch, packed-refs and the index are unchanged, it may
+# still miss work tree changes and has to be revalidated.
+
+__all__ = ['get_cache_key', 'load_snapshot', 'store_snapshot']
+
+import hashlib
+import json
+import os
+import threading
+import zlib
+from pathlib import Path
+
+import gi
+
+gi.require_version('GLib', '2.0')
+from gi.repository import GLib
+
+from status import GitStatus, StatusEntry
+
+# Total size of the cache directory, the least recently used snapshots are removed beyond that
+SNAPSHOT_CACHE_BYTES = 16 * 1024 * 1024
+
+# Bumped whenever the file format changes
+SNAPSHOT_CACHE_VERSION = 1
+
+# Long enough for the SHA-1 or SHA-256 checksum git writes at the end of the index
+INDEX_CHECKSUM_SIZE = 32
+
+
+def get_cache_dir():
+    return Path(GLib.get_user_cache_dir(), 'caja-git')
+
+
+def get_cache_file(path):
+    return get_cache_dir() / f'{hashlib.sha1(os.fsencode(path)).hexdigest()}.status'
+
+
+def read_text(path):
+    try:
+        return Path(path).read_text(encoding='utf-8', errors='surrogateescape').strip()
+    except OSError:
+        return None
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_index_stamp(git_dir):
+    try:
+        with open(Path(git_dir, 'index'), 'rb') as f:
+            st = os.fstat(f.fileno())
+            f.seek(max(0, st.st_size - INDEX_CHECKSUM_SIZE))
+
+            return [st.st_mtime_ns, st.st_size, f.read().hex()]
+    except OSError:
+        return None
+
+
+# Changes whenever HEAD, the commit of the current branch or the index do
+def get_cache_key(git_dir, common_dir):
+    head = read_text(Path(git_dir, 'HEAD'))
+
+    ref = None
+    if head is not None and head.startswith('ref:'):
+        ref = read_text(Path(common_dir, head[len('ref:'):].strip()))
+
+    return [head, ref, get_mtime(Path(common_dir, 'packed-refs')), get_index_stamp(git_dir)]
+
+
+def load_snapshot(path, key):
+    cache_file = get_cache_file(path)
+    try:
+        data = json.loads(zlib.decompress(cache_file.read_bytes()))
+    except (OSError, ValueError, zlib.error):
+        return None
+
+    if data.get('version') != SNAPSHOT_CACHE_VERSION or data.get('path') != path or data.get('key') != key:
+        return None
+
+    # The modification time orders snapshots for eviction
+    try:
+        os.utime(cache_file)
+    except OSError:
+        pass
+
+    try:
+        return GitStatus(*data['status'][:5], tuple(StatusEntry(*e) for e in data['entries']), data['status'][5])
+    except (KeyError, TypeError):
+        return None
+
+
+def store_snapshot(path, key, snapshot):
+    data = {
+        'version': SNAPSHOT_CACHE_VERSION,
+        'path': path,
+        'key': key,
+        'status': [snapshot.branch, snapshot.oid, snapshot.upstream, snapshot.ahead, snapshot.behind,
+                   snapshot.truncated],
+        'entries': snapshot.entries
+    }
+    blob = zlib.compress(json.dumps(data, separators=(',', ':')).encode())
+    if len(blob) > SNAPSHOT_CACHE_BYTES // 4:
+        return
+
+    cache_file = get_cache_file(path)
+    tmp_file = cache_file.with_name(f'.{cache_file.name}.{os.getpid()}.{threading.get_ident()}')
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file.write_bytes(blob)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        try:
+            tmp_file.unlink()
+        except OSError:
+            pass
+
+        return
+
+    evict()
+
+
+def evict():
+    files = []
+    for entry in os.scandir(get_cache_dir()):
+        try:
+            if entry.name.endswith('.status'):
+                st = entry.stat()
+                files.append((st.st_mtime_ns, st.st_size, entry.path))
+        except OSError:
+            pass
+
+    size = sum(f[1] for f in files)
+    for _, file_size, file in sorted(files):
+        if size <= SNAPSHOT_CACHE_BYTES:
+            break
+
+        try:
+            os.unlink(file)
+            size -= file_size
+        except OSError:
+            pass
+
+# vim: ft=python3 ts=4 et
@@ -0,0 +1,116 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+__all__ = ['GitStatus', 'StatusEntry', 'parse_numstat', 'parse_status']
+
+from collections import namedtuple
+
+# `index` and `worktree` are the X and Y columns of `git status --porcelain=v2`, '.' means unchanged
+# and untracked files use '?' for both
+StatusEntry = namedtuple('StatusEntry', ['path', 'orig_path', 'index', 'worktree', 'head_oid', 'index_oid',
+                                         'conflicted'])
+
+
+# `truncated` is set when git was stopped by a timeout or more than the maximum number of entries were listed
+class GitStatus(namedtuple('GitStatus', ['branch', 'oid', 'upstream', 'ahead', 'behind', 'entries', 'truncated'])):
+    __slots__ = ()
+
+    @property
+    def head(self):
+        return self.oid if self.branch is None else self.branch
+
+    @property
+    def staged(self):
+        return tuple(e for e in self.entries if e.index not in '.?' and not e.conflicted)
+
+    @property
+    def unstaged(self):
+        return tuple(e for e in self.entries if e.worktree not in '.?' and not e.conflicted)
+
+    @property
+    def untracked(self):
+        return tuple(e for e in self.entries if e.index == '?')
+
+    @property
+    def deleted(self):
+        return tuple(e for e in self.entries if 'D' in (e.index, e.worktree) and not e.conflicted)
+
+    @property
+    def renamed(self):
+        return tuple(e for e in self.entries if e.orig_path is not None)
+
+    @property
+    def conflicted(self):
+        return tuple(e for e in self.entries if e.conflicted)
+
+
+def parse_status(output, max_entries=None, truncated=False):
+    branch = oid = upstream = None
+    ahead = behind = 0
+    entries = []
+
+    records = iter(output.split('\0'))
+    for record in records:
+        kind, _, rest = record.partition(' ')
+        if max_entries is not None and len(entries) >= max_entries and kind not in ('#', ''):
+            truncated = True
+            break
+
+        if kind == '#':
+            key, _, value = rest.partition(' ')
+            if key == 'branch.oid':
+                oid = None if value == '(initial)' else value
+            elif key == 'branch.head':
+                branch = None if value == '(detached)' else value
+            elif key == 'branch.upstream':
+                upstream = value
+            elif key == 'branch.ab':
+                ahead, behind = (abs(int(n)) for n in value.split())
+        elif kind == '1':
+            xy, _, _, _, _, head_oid, index_oid, path = rest.split(' ', 7)
+            entries.append(StatusEntry(path, None, xy[0], xy[1], head_oid, index_oid, False))
+        elif kind == '2':
+            xy, _, _, _, _, head_oid, index_oid, _, path = rest.split(' ', 8)
+            entries.append(StatusEntry(path, next(records, None), xy[0], xy[1], head_oid, index_oid, False))
+        elif kind == 'u':
+            xy, _, _, _, _, _, _, ours_oid, _, path = rest.split(' ', 9)
+            entries.append(StatusEntry(path, None, xy[0], xy[1], ours_oid, None, True))
+        elif kind == '?':
+            entries.append(StatusEntry(rest, None, '?', '?', None, None, False))
+
+    return GitStatus(branch, oid, upstream, ahead, behind, tuple(entries), truncated)
+
+
+# Parses `git diff --numstat -z` into {path: (added, deleted)}, binary files map to None
+def parse_numstat(output):
+    numstat = {}
+
+    records = iter(output.split('\0'))
+    for record in records:
+        if not record:
+            continue
+
+        added, deleted, path = record.split('\t', 2)
+        if not path:
+            # Renames put the old and new path in the following records
+            next(records, None)
+            path = next(records, '')
+
+        numstat[path] = None if added == '-' else (int(added), int(deleted))
+
+    return numstat
+
+# vim: ft=python3 ts=4 et
@@ -0,0 +1,113 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+__all__ = ['STATE_CONFLICTED', 'STATE_MODIFIED', 'STATE_STAGED', 'STATE_UNTRACKED', 'StatusIndex', 'get_states']
+
+# Ordered by precedence, a directory takes the highest state found below it
+STATE_UNTRACKED = 0
+STATE_STAGED = 1
+STATE_MODIFIED = 2
+STATE_CONFLICTED = 3
+
+STATE_COUNT = 4
+
+
+# Maps the paths of a status snapshot to their state, untracked directories are listed as 'dir/'
+def get_states(snapshot):
+    states = {}
+    for entry in snapshot.entries:
+        if entry.conflicted:
+            state = STATE_CONFLICTED
+        elif entry.worktree not in '.?':
+            state = STATE_MODIFIED
+        elif entry.index not in '.?':
+            state = STATE_STAGED
+        else:
+            state = STATE_UNTRACKED
+
+        states[entry.path] = state
+
+    return states
+
+
+def get_parents(path):
+    while (i := path.rfind('/')) != -1:
+        path = path[:i]
+        yield path
+
+    yield ''
+
+
+# Path -> state lookups for the files and directories of a work tree, paths are relative to the top-level
+# directory and use '/'. Directory states are kept as per-state counts of the paths below them, so `update()`
+# only touches the changed paths and their parents.
+class StatusIndex:
+    def __init__(self):
+        self.states = {}
+        self.dir_counts = {}
+        self.untracked_dirs = set()
+
+    def get(self, path):
+        if (state := self.states.get(path)) is not None:
+            return state
+
+        if (counts := self.dir_counts.get(path)) is not None:
+            return max(s for s in range(STATE_COUNT) if counts[s])
+
+        # Files inside untracked directories are not listed individually
+        if self.untracked_dirs and any(p in self.untracked_dirs for p in get_parents(path)):
+            return STATE_UNTRACKED
+
+        return None
+
+    def count(self, path, state, delta):
+        for parent in get_parents(path):
+            if (counts := self.dir_counts.get(parent)) is None:
+                counts = self.dir_counts[parent] = [0] * STATE_COUNT
+
+            counts[state] += delta
+            if not any(counts):
+                del self.dir_counts[parent]
+
+        if path.endswith('/'):
+            if delta > 0:
+                self.untracked_dirs.add(path[:-1])
+            else:
+                self.untracked_dirs.discard(path[:-1])
+
+    # Replaces the states with `states` (see `get_states()`) and returns the paths whose state may have changed,
+    # an untracked directory that appeared or disappeared is returned as 'dir/' to stand for everything inside it
+    def update(self, states):
+        changed = set()
+
+        for path, state in self.states.items():
+            if states.get(path) != state:
+                self.count(path, state, -1)
+                changed.add(path)
+
+        for path, state in states.items():
+            if self.states.get(path) != state:
+                self.count(path, state, 1)
+                changed.add(path)
+
+        self.states = states
+
+        for path in list(changed):
+            changed.update(get_parents(path))
+
+        return changed
+
+# vim: ft=python3 ts=4 et
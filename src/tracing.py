@@ -0,0 +1,179 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+# CAJA_GIT_TRACE=1 records git commands, UI updates and main loop stalls and prints a summary to stderr on exit,
+# CAJA_GIT_TRACE_FILE=<path> also writes the events as Chrome trace JSON (chrome://tracing or ui.perfetto.dev)
+
+__all__ = ['TRACE_ENABLED', 'get_events', 'record', 'span', 'summarize', 'traced', 'watch_main_loop']
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+from contextlib import contextmanager
+from functools import wraps
+
+import gi
+
+gi.require_version('GLib', '2.0')
+from gi.repository import GLib
+
+TRACE_FILE = os.environ.get('CAJA_GIT_TRACE_FILE') or None
+TRACE_ENABLED = TRACE_FILE is not None or os.environ.get('CAJA_GIT_TRACE', '0') not in ('', '0')
+
+# Only the most recent events are kept
+TRACE_BUFFER_SIZE = 10000
+
+# The main loop is considered blocked when a probe this often runs late by more than its interval
+MAIN_LOOP_PROBE_MS = 50
+
+# `start` and `duration` are in nanoseconds of time.perf_counter_ns()
+Event = namedtuple('Event', ['category', 'name', 'start', 'duration', 'thread', 'args'])
+
+# Appending to a deque is atomic, worker threads record without taking a lock
+_events = deque(maxlen=TRACE_BUFFER_SIZE)
+_main_loop_probe_id = 0
+
+
+def record(category, name, start, end, **args):
+    if TRACE_ENABLED:
+        _events.append(Event(category, name, start, end - start, threading.get_ident(), args))
+
+
+# Times the block, it can add to the yielded dict, e.g. an exit status only known at the end
+@contextmanager
+def span(category, name, **args):
+    if not TRACE_ENABLED:
+        yield args
+        return
+
+    start = time.perf_counter_ns()
+    try:
+        yield args
+    finally:
+        record(category, name, start, time.perf_counter_ns(), **args)
+
+
+# Method decorator recording each call as '<class>.<method>', a no-op unless tracing is enabled
+def traced(category):
+    def decorator(func):
+        if not TRACE_ENABLED:
+            return func
+
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with span(category, f'{type(self).__name__}.{func.__name__}'):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def watch_main_loop():
+    global _main_loop_probe_id
+
+    if not TRACE_ENABLED or _main_loop_probe_id:
+        return
+
+    last = time.perf_counter_ns()
+
+    def probe():
+        nonlocal last
+
+        now = time.perf_counter_ns()
+        if (now - last) // 1_000_000 > 2 * MAIN_LOOP_PROBE_MS:
+            record('main-loop', 'blocked', last + MAIN_LOOP_PROBE_MS * 1_000_000, now)
+
+        last = now
+
+        return True
+
+    _main_loop_probe_id = GLib.timeout_add(MAIN_LOOP_PROBE_MS, probe)
+
+
+def get_events():
+    return list(_events)
+
+
+def percentile(durations, q):
+    return durations[min(len(durations) - 1, int(q * len(durations)))]
+
+
+# Returns {(category, name): {'count', 'p50', 'p95', 'max'}}, durations in milliseconds
+def summarize(events=None):
+    durations = defaultdict(list)
+    for event in get_events() if events is None else events:
+        durations[(event.category, event.name)].append(event.duration / 1_000_000)
+
+    summary = {}
+    for key, samples in durations.items():
+        samples.sort()
+        summary[key] = {
+            'count': len(samples),
+            'p50': percentile(samples, 0.5),
+            'p95': percentile(samples, 0.95),
+            'max': samples[-1]
+        }
+
+    return summary
+
+
+def print_summary(file=sys.stderr):
+    summary = summarize()
+
+    print(f'caja-git trace: {len(_events)} events', file=file)
+    print(f'{"category":<10} {"name":<40} {"count":>7} {"p50 ms":>9} {"p95 ms":>9} {"max ms":>9}', file=file)
+    for (category, name), stats in sorted(summary.items(), key=lambda item: -item[1]['max']):
+        print(f'{category:<10} {name[:40]:<40} {stats["count"]:>7} '
+              f'{stats["p50"]:>9.2f} {stats["p95"]:>9.2f} {stats["max"]:>9.2f}', file=file)
+
+
+def write_chrome_trace(path):
+    pid = os.getpid()
+
+    trace_events = [{
+        'name': e.name,
+        'cat': e.category,
+        'ph': 'X',
+        'ts': e.start / 1000,
+        'dur': e.duration / 1000,
+        'pid': pid,
+        'tid': e.thread,
+        'args': e.args
+    } for e in get_events()]
+
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f, default=str)
+
+
+def dump():
+    print_summary()
+
+    if TRACE_FILE is not None:
+        try:
+            write_chrome_trace(TRACE_FILE)
+        except OSError as e:
+            print(f'caja-git trace: cannot write {TRACE_FILE}: {e}', file=sys.stderr)
+
+
+if TRACE_ENABLED:
+    atexit.register(dump)
+
+# vim: ft=python3 ts=4 et
@@ -16,10 +16,18 @@
 
 __all__ = ['GitBranchDialog']
 
+import subprocess
+
 import gi
 
 gi.require_version('Gtk', '3.0')
-from gi.repository import GObject, Gtk
+from gi.repository import Gio, GLib, GObject, Gtk
+
+from tracing import traced
+from utils import run_async
+
+# Only this many matching branches are put in the combo, typing narrows them down
+BRANCH_COMBO_LIMIT = 100
 
 
 @Gtk.Template(resource_path='/org/mate/caja/extensions/git/ui/gitbranchdialog.ui')
@@ -37,36 +45,130 @@ class GitBranchDialog(Gtk.Dialog):
         super().__init__()
 
         self.git = git
+        self.branches = None
+        self.shown_branches = None
+        self.fill_id = 0
+        self.switching = False
+        self.cancellable = Gio.Cancellable.new()
 
-        self.set_title(f'Branch for {self.git.get_project_name()}')
+        self.set_title('Branch')
         self.set_transient_for(window)
+        self.set_sensitive(False)
+
+        # A checkout is not interrupted halfway by closing the dialog
+        self.connect('delete-event', lambda *_: self.switching)
+        self.connect('destroy', self.destroyed)
+
+        run_async(self.query, self.update_ui, self.cancellable)
+
+    def query(self, cancellable):
+        return (self.git.get_project_name(cancellable),
+                self.git.get_current_branch(cancellable),
+                self.git.get_branch_index(cancellable))
+
+    @traced('ui')
+    def update_ui(self, result):
+        # There is nothing to switch to if git could not be run
+        if result is None:
+            self.destroy()
+            return
+
+        project_name, current_branch, self.branches = result
+
+        self.set_title(f'Branch for {project_name}')
+
+        self.fill_branch_combo('')
+        self.branch_entry.set_text(current_branch)
+
+        self.set_sensitive(True)
+
+    def fill_branch_combo(self, prefix):
+        self.fill_id = 0
+
+        if (branches := self.branches.complete(prefix, BRANCH_COMBO_LIMIT)) != self.shown_branches:
+            self.shown_branches = branches
 
-        current_branch = self.git.get_current_branch()
-        index = 0
-        for i, branch in enumerate(self.git.get_local_branches()):
-            if branch == current_branch:
-                index = i
+            self.branch_combo.remove_all()
+            for branch in branches:
+                self.branch_combo.append_text(branch)
 
-            self.branch_combo.append_text(branch)
+        return False
 
-        self.branch_combo.set_active(index)
+    def destroyed(self, *_):
+        self.cancellable.cancel()
+
+        if self.fill_id:
+            GLib.source_remove(self.fill_id)
 
     @Gtk.Template.Callback()
     def branch_entry_changed(self, *_):
+        if self.branches is None:
+            return
+
         branch = self.branch_entry.get_text().strip()
-        if branch and branch in self.git.get_local_branches():
+        if branch and branch in self.branches:
             self.branch_entry.get_style_context().remove_class('error')
         else:
             self.branch_entry.get_style_context().add_class('error')
 
-    @Gtk.Template.Callback()
-    def apply_button_clicked(self, *_):
-        if branch := self.branch_entry.get_text().strip():
-            self.git.switch_branch(branch, self)
+            # Refill outside of the signal emission, the combo may be the one changing the entry
+            if not self.fill_id:
+                self.fill_id = GLib.idle_add(lambda: self.fill_branch_combo(self.branch_entry.get_text().strip()))
 
-            self.emit('refresh')
+    # Returns git's error message, '' once the branch is switched
+    def switch_branch(self, branch, create):
+        try:
+            self.git.switch_branch(branch, create)
+        except subprocess.CalledProcessError as e:
+            return e.stderr or f'git checkout exited with status {e.returncode}'
 
-        self.destroy()
+        return ''
+
+    @traced('ui')
+    def branch_switched(self, error):
+        self.switching = False
+
+        # Even a failed checkout may have changed something
+        self.emit('refresh')
+
+        if error == '':
+            self.destroy()
+            return
+
+        dialog = Gtk.MessageDialog(transient_for=self,
+                                   flags=0,
+                                   message_type=Gtk.MessageType.ERROR,
+                                   buttons=Gtk.ButtonsType.CLOSE,
+                                   text='Could not switch branches')
+        dialog.format_secondary_text(error or 'git could not be run')
+        dialog.run()
+        dialog.destroy()
+
+        self.set_sensitive(True)
+
+    @Gtk.Template.Callback()
+    def apply_button_clicked(self, *_):
+        if not (branch := self.branch_entry.get_text().strip()):
+            self.destroy()
+            return
+
+        if create := branch not in self.branches:
+            dialog = Gtk.MessageDialog(transient_for=self,
+                                       flags=0,
+                                       message_type=Gtk.MessageType.QUESTION,
+                                       buttons=Gtk.ButtonsType.YES_NO,
+                                       text=f"The '{branch}' branch does not exist. Do you want to create it?")
+            response = dialog.run()
+            dialog.destroy()
+
+            if response != Gtk.ResponseType.YES:
+                self.destroy()
+                return
+
+        # Large work trees can take a while to check out, the dialog waits for it without blocking Caja
+        self.switching = True
+        self.set_sensitive(False)
+        run_async(lambda _: self.switch_branch(branch, create), self.branch_switched)
 
     @Gtk.Template.Callback()
     def cancel_button_clicked(self, *_):
@@ -16,11 +16,24 @@
 
 __all__ = ['GitDiffDialog']
 
+import codecs
+import time
+
 import gi
 
 gi.require_version('Gdk', '3.0')
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gdk, Gtk
+from gi.repository import Gdk, Gio, GLib, Gtk
+
+from diffparser import Diff, apply_diff_tags, split_lines
+from tracing import record, traced
+from utils import run_async
+
+DIFF_CHUNK_SIZE = 64 * 1024
+
+# The diff stops loading after this much until "Load More" is clicked
+DIFF_PAGE_BYTES = 1024 * 1024
+DIFF_PAGE_LINES = 20000
 
 
 class Scheme:
@@ -73,16 +86,40 @@ class GitDiffDialog(Gtk.Dialog):
     close_button = Gtk.Template.Child()
     diffstat_label = Gtk.Template.Child()
     diff_view = Gtk.Template.Child()
+    load_more_button = Gtk.Template.Child()
     modified_combo = Gtk.Template.Child()
 
-    def __init__(self, git, window):
+    def __init__(self, git, window, page_bytes=DIFF_PAGE_BYTES, page_lines=DIFF_PAGE_LINES):
         super().__init__()
 
         self.git = git
-
-        self.set_title(f'Diff for {self.git.get_project_name()}')
+        self.page_bytes = page_bytes
+        self.page_lines = page_lines
+        self.cancellable = Gio.Cancellable.new()
+        self.buffer_cancellable = None
+
+        self.proc = None
+        self.stream = None
+        self.decoder = None
+        self.pending = ''
+        self.diff = None
+        self.diff_key = None
+        self.cached_text = None
+        self.cached_offset = 0
+        self.cached_line = 0
+        self.chunks = None
+        self.chunks_size = 0
+        self.snapshot = None
+        self.loaded_bytes = 0
+        self.loaded_lines = 0
+        self.stream_start = 0
+        self.stream_bytes = 0
+
+        self.set_title('Diff')
         self.set_transient_for(window)
 
+        self.connect('destroy', self.destroyed)
+
         scheme = Scheme(window)
 
         self.buf = self.diff_view.get_buffer()
@@ -90,54 +127,223 @@ class GitDiffDialog(Gtk.Dialog):
         self.buf.create_tag('added', background_rgba=scheme.added_bg_color)
         self.buf.create_tag('deleted', background_rgba=scheme.deleted_bg_color)
 
-        if files := self.git.get_modified():
-            store = Gtk.ListStore.new([str, str])
-            for file in files:
-                store.append(file)
+        run_async(self.query, self.update_ui, self.cancellable)
+
+    def query(self, cancellable):
+        return (self.git.get_project_name(cancellable),
+                self.git.get_snapshot(cancellable),
+                self.git.get_modified(cancellable),
+                self.git.get_numstats(cancellable))
+
+    @traced('ui')
+    def update_ui(self, result):
+        # The dialog stays empty if git could not be run
+        if result is None:
+            return
+
+        project_name, self.snapshot, files, numstats = result
+
+        self.set_title(f'Diff for {project_name}')
+
+        if files:
+            # Filename, staged flag, added and deleted columns, diffstat label
+            store = Gtk.ListStore.new([str, str, str, str, str])
+            for filename, staged in files:
+                if filename not in numstats[staged]:
+                    store.append([filename, staged, '', '', ''])
+                elif (numstat := numstats[staged][filename]) is None:
+                    store.append([filename, staged, 'bin', '', 'Binary file'])
+                else:
+                    added, deleted = numstat
+                    store.append([filename,
+                                  staged,
+                                  f'+{added}',
+                                  f'-{deleted}',
+                                  f'{added} insertions(+), {deleted} deletions(-)'])
 
             self.modified_combo.set_model(store)
 
-            renderer = Gtk.CellRendererText.new()
-            self.modified_combo.pack_start(renderer, True)
-            self.modified_combo.add_attribute(renderer, 'text', 0)
-
-            renderer = Gtk.CellRendererText.new()
-            self.modified_combo.pack_start(renderer, True)
-            self.modified_combo.add_attribute(renderer, 'text', 1)
+            for column in range(4):
+                renderer = Gtk.CellRendererText.new()
+                self.modified_combo.pack_start(renderer, column == 0)
+                self.modified_combo.add_attribute(renderer, 'text', column)
 
             self.modified_combo.set_active(0)
 
-            self.set_buffer(*files[0])
+    @traced('ui')
+    def set_buffer(self, filename, staged, diffstat):
+        # Picking another file supersedes the diff still being loaded
+        self.stop_stream()
+
+        self.buffer_cancellable = Gio.Cancellable.new()
+
+        self.diffstat_label.set_text(diffstat)
+        self.load_more_button.hide()
+
+        identity = self.git.get_diff_identity(self.snapshot, filename, staged == 'S')
+        self.diff_key = (filename, staged == 'S', identity)
+        self.buf.set_text('')
+
+        # A cached diff is paged in like a streamed one, only its lines are already classified
+        if (cached := self.git.diff_cache.get(self.diff_key)) is not None:
+            self.cached_text, self.diff = cached
+            self.cached_offset = self.cached_line = 0
+
+            self.read_page()
+            return
+
+        self.cached_text = None
+
+        self.chunks = [] if identity is not None else None
+        self.chunks_size = 0
+        self.pending = ''
+        self.diff = Diff()
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+        try:
+            self.proc = self.git.spawn_diff(filename, staged == 'S')
+        except GLib.Error:
+            return
+
+        self.stream = self.proc.get_stdout_pipe()
+        self.stream_start = time.perf_counter_ns()
+        self.stream_bytes = 0
+        self.read_page()
+
+    def stop_stream(self):
+        if self.buffer_cancellable is not None:
+            self.buffer_cancellable.cancel()
+
+        if self.proc is not None:
+            self.proc.force_exit()
+
+        self.proc = self.stream = None
+
+    def read_page(self):
+        self.loaded_bytes = self.loaded_lines = 0
+        self.read_chunk()
+
+    def read_chunk(self):
+        if self.cached_text is not None:
+            GLib.idle_add(self.cached_chunk_read, self.buffer_cancellable, priority=GLib.PRIORITY_DEFAULT_IDLE)
+            return
+
+        self.stream.read_bytes_async(DIFF_CHUNK_SIZE,
+                                     GLib.PRIORITY_DEFAULT_IDLE,
+                                     self.buffer_cancellable,
+                                     self.chunk_read,
+                                     self.stream)
+
+    def chunk_read(self, source, result, stream):
+        try:
+            data = source.read_bytes_finish(result).get_data()
+        except GLib.Error:
+            return
 
-    def get_iters_at_line(self, line_nr):
-        return self.buf.get_iter_at_line(line_nr), self.buf.get_iter_at_line(line_nr + 1)
+        # A newer diff has been requested in the meantime
+        if stream is not self.stream:
+            return
 
-    def set_buffer(self, filename, staged):
-        diff = self.git.get_diff(filename, staged == 'S')
-        self.buf.set_text(diff)
+        if not data:
+            record('git', 'git diff', self.stream_start, time.perf_counter_ns(),
+                   pid=self.proc.get_identifier(), cwd=self.git.path, output_bytes=self.stream_bytes)
 
-        for i, line in enumerate(diff.splitlines()):
-            if i < 4:
-                continue
+            self.append_text(self.decoder.decode(b'', final=True), final=True)
+            self.stop_stream()
 
-            if line.startswith('@@'):
-                self.buf.apply_tag_by_name('chunk_header', *self.get_iters_at_line(i))
-            elif line.startswith('+'):
-                self.buf.apply_tag_by_name('added', *self.get_iters_at_line(i))
-            elif line.startswith('-'):
-                self.buf.apply_tag_by_name('deleted', *self.get_iters_at_line(i))
+            if self.chunks is not None:
+                self.git.diff_cache.put(self.diff_key, ''.join(self.chunks), self.diff)
 
-        if (diffstat := self.git.get_diffstat(filename, staged == 'S')) is None:
-            self.diffstat_label.set_text('')
+            return
+
+        self.append_text(self.decoder.decode(data))
+
+        self.stream_bytes += len(data)
+        self.loaded_bytes += len(data)
+        if self.loaded_bytes >= self.page_bytes or self.loaded_lines >= self.page_lines:
+            self.load_more_button.show()
+        else:
+            self.read_chunk()
+
+    # Inserts the next DIFF_CHUNK_SIZE characters of the cached diff, up to the end of a line
+    @traced('ui')
+    def cached_chunk_read(self, cancellable):
+        # Another file has been picked or the dialog closed in the meantime
+        if cancellable.is_cancelled():
+            return False
+
+        text = self.cached_text
+        if (end := text.find('\n', self.cached_offset + DIFF_CHUNK_SIZE)) == -1:
+            end = len(text)
+        else:
+            end += 1
+
+        chunk = text[self.cached_offset:end]
+        self.cached_offset = end
+
+        self.buf.insert(self.buf.get_end_iter(), chunk)
+
+        start = self.cached_line
+        self.cached_line += len(split_lines(chunk))
+        apply_diff_tags(self.buf, self.diff, start, self.cached_line)
+
+        if self.cached_offset >= len(text):
+            return False
+
+        self.loaded_bytes += len(chunk)
+        self.loaded_lines += self.cached_line - start
+        if self.loaded_bytes >= self.page_bytes or self.loaded_lines >= self.page_lines:
+            self.load_more_button.show()
+        else:
+            self.read_chunk()
+
+        return False
+
+    @traced('ui')
+    def append_text(self, text, final=False):
+        text = self.pending + text
+        if final:
+            self.pending = ''
         else:
-            self.diffstat_label.set_text(diffstat)
+            text, newline, self.pending = text.rpartition('\n')
+            text += newline
+
+        if not text:
+            return
+
+        self.buf.insert(self.buf.get_end_iter(), text)
+
+        # Keep the text for the cache unless it is too big to be cached anyway
+        if self.chunks is not None:
+            self.chunks.append(text)
+            self.chunks_size += len(text)
+            if self.chunks_size > self.git.diff_cache.max_bytes:
+                self.chunks = None
+
+        start = len(self.diff)
+        lines = split_lines(text)
+        self.diff.feed(lines)
+        apply_diff_tags(self.buf, self.diff, start)
+
+        self.loaded_lines += len(lines)
 
     @Gtk.Template.Callback()
     def modified_combo_changed(self, combo):
         if (iter_ := combo.get_active_iter()) is not None:
             model = combo.get_model()
-            filename, staged = model[iter_][:2]
-            self.set_buffer(filename, staged)
+            filename, staged, *_, diffstat = model[iter_]
+            self.set_buffer(filename, staged, diffstat)
+
+    def destroyed(self, *_):
+        self.cancellable.cancel()
+
+        self.stop_stream()
+
+    @Gtk.Template.Callback()
+    def load_more_button_clicked(self, *_):
+        self.load_more_button.hide()
+
+        self.read_page()
 
     @Gtk.Template.Callback()
     def close_button_clicked(self, *_):
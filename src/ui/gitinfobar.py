@@ -25,76 +25,129 @@ from gi.repository import Gtk
 
 from .gitbranchdialog import GitBranchDialog
 from .gitdiffdialog import GitDiffDialog
-from utils import Git
+from .visibility import RepositoryView
 
 
 @Gtk.Template(resource_path='/org/mate/caja/extensions/git/ui/gitinfobar.ui')
-class GitInfoBar(Gtk.InfoBar):
+class GitInfoBar(RepositoryView, Gtk.InfoBar):
     __gtype_name__ = 'GitInfoBar'
 
     branch_button = Gtk.Template.Child()
     deleted_button = Gtk.Template.Child()
     deleted_popover = Gtk.Template.Child()
+    deleted_store = Gtk.Template.Child()
+    deleted_view = Gtk.Template.Child()
     diff_button = Gtk.Template.Child()
     modified_button = Gtk.Template.Child()
     modified_popover = Gtk.Template.Child()
+    modified_store = Gtk.Template.Child()
+    modified_view = Gtk.Template.Child()
     more_button = Gtk.Template.Child()
     more_popover = Gtk.Template.Child()
     new_file_button = Gtk.Template.Child()
     new_file_popover = Gtk.Template.Child()
+    new_file_store = Gtk.Template.Child()
+    new_file_view = Gtk.Template.Child()
     open_remote_url_button = Gtk.Template.Child()
+    spinner = Gtk.Template.Child()
 
     def __init__(self, path, window):
         super().__init__()
 
-        self.git = Git(path)
         self.window = window
+        self.remote_url = None
+        self.status = None
 
-        self.update_ui()
+        self.show_placeholder()
 
         self.new_file_button.connect('clicked', lambda _, p: self.show_popover(p), self.new_file_popover)
         self.modified_button.connect('clicked', lambda _, p: self.show_popover(p), self.modified_popover)
         self.deleted_button.connect('clicked', lambda _, p: self.show_popover(p), self.deleted_popover)
         self.more_button.connect('clicked', lambda _, p: self.show_popover(p), self.more_popover)
 
-        self.git.connect('refresh', lambda _: self.refresh())
+        self.watch_repository(path)
 
-    def update_ui(self):
-        self.branch_button.set_label(self.git.get_current_branch())
+    def show_placeholder(self):
+        self.branch_button.set_label('…')
 
-        status = self.git.get_status()
         for prefix in ['deleted', 'modified', 'new_file']:
-            button = getattr(self, f'{prefix}_button')
-            if filenames := status[prefix]:
-                button.set_label(str(len(filenames)))
+            getattr(self, f'{prefix}_button').hide()
+
+        self.status = None
+
+        self.more_button.set_sensitive(False)
+
+    def query(self, cancellable):
+        return (self.git.get_current_branch(cancellable),
+                self.git.get_status(cancellable),
+                self.git.get_remote_url(cancellable),
+                self.git.get_modified(cancellable))
+
+    def query_snapshot(self, snapshot):
+        return (snapshot.head,
+                self.git.get_status(snapshot=snapshot),
+                self.git.get_remote_url(),
+                self.git.get_modified(snapshot=snapshot))
+
+    def update_ui(self, result):
+        self.spinner.stop()
+        self.spinner.hide()
+
+        super().update_ui(result)
 
-                vbox = Gtk.Box.new(Gtk.Orientation.VERTICAL, 6)
-                for filename in filenames:
-                    label = Gtk.Label.new(filename)
-                    label.set_halign(Gtk.Align.START)
-                    vbox.pack_start(label, False, False, 0)
+    def show_result(self, result):
+        branch, status, self.remote_url, modified = result
 
-                vbox.show_all()
+        if self.branch_button.get_label() != branch:
+            self.branch_button.set_label(branch)
 
-                popover = getattr(self, f'{prefix}_popover')
-                popover.add(vbox)
+        # Only the lists that differ from the previous status are touched
+        for prefix in ['deleted', 'modified', 'new_file']:
+            filenames = status[prefix]
+            if self.status is not None and self.status[prefix] == filenames \
+                    and self.status['truncated'] == status['truncated']:
+                continue
+
+            button = getattr(self, f'{prefix}_button')
+            if filenames:
+                # Large repositories stop listing files at a limit or a timeout
+                button.set_label(f'{len(filenames)}+' if status['truncated'] else str(len(filenames)))
+                button.show()
             else:
                 button.hide()
 
-        if has_remote := bool(self.git.get_remote_url()):
+            # Detach the model while refilling it so the view does not react to every row
+            store = getattr(self, f'{prefix}_store')
+            view = getattr(self, f'{prefix}_view')
+            view.set_model(None)
+            store.clear()
+            for filename in filenames:
+                store.append([filename])
+            view.set_model(store)
+
+        self.status = status
+
+        if has_remote := bool(self.remote_url):
             self.open_remote_url_button.show()
         else:
             self.open_remote_url_button.hide()
 
-        if has_modified := self.git.get_modified():
+        if has_modified := bool(modified):
             self.diff_button.show()
         else:
             self.diff_button.hide()
 
         self.more_button.set_sensitive(has_remote or has_modified)
 
+    def show_error(self):
+        self.branch_button.set_label('?')
+
     def refresh(self):
-        self.update_ui()
+        super().refresh()
+
+        # The previous values stay visible while the new status is being computed
+        self.spinner.show()
+        self.spinner.start()
 
     def show_popover(self, popover):
         if popover.get_visible():
@@ -106,11 +159,11 @@ class GitInfoBar(Gtk.InfoBar):
     def branch_button_clicked(self, *_):
         dialog = GitBranchDialog(self.git, self.window)
 
-        dialog.connect('refresh', lambda _: self.refresh())
+        dialog.connect('refresh', lambda _: self.git.refresh())
 
     @Gtk.Template.Callback()
     def open_remote_url_button_clicked(self, *_):
-        webbrowser.open(self.git.get_remote_url())
+        webbrowser.open(self.remote_url)
 
         self.more_popover.hide()
 
@@ -0,0 +1,115 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+__all__ = ['GitMultiPropertyPage']
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import gi
+
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gio, Gtk
+
+from tracing import traced
+from utils import acquire_git, release_git, run_async
+
+# Repositories queried at the same time, each query runs one git process at a time
+MULTI_REPO_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+_executor = ThreadPoolExecutor(max_workers=MULTI_REPO_WORKERS, thread_name_prefix='caja-git-multi')
+
+
+def format_status(status):
+    suffix = '+' if status['truncated'] else ''
+    counts = [(len(status['modified']), 'modified'),
+              (len(status['new_file']), 'new'),
+              (len(status['deleted']), 'deleted')]
+    if not (parts := [f'{n}{suffix} {label}' for n, label in counts if n]):
+        return 'Clean'
+
+    return ', '.join(parts)
+
+
+@Gtk.Template(resource_path='/org/mate/caja/extensions/git/ui/gitmultipropertypage.ui')
+class GitMultiPropertyPage(Gtk.Box):
+    __gtype_name__ = 'GitMultiPropertyPage'
+
+    repository_store = Gtk.Template.Child()
+    repository_view = Gtk.Template.Child()
+    summary_label = Gtk.Template.Child()
+
+    # `paths` are the top-level directories of the repositories to show
+    def __init__(self, paths):
+        super().__init__()
+
+        self.cancellable = Gio.Cancellable.new()
+        self.gits = []
+        self.done = 0
+        self.dirty = 0
+
+        # Every repository gets a row right away, which is filled in as soon as its own query finishes
+        for path in paths:
+            git = acquire_git(path)
+            git.revalidate()
+            self.gits.append(git)
+
+            iter_ = self.repository_store.append([Path(path).name, '…', '…', path])
+            run_async(partial(self.query, git), partial(self.update_row, iter_), self.cancellable, _executor)
+
+        self.update_summary()
+
+        self.connect('destroy', self.destroyed)
+
+    def query(self, git, cancellable):
+        return git.get_current_branch(cancellable), git.get_status(cancellable)
+
+    @traced('ui')
+    def update_row(self, iter_, result):
+        self.done += 1
+
+        if result is None:
+            self.repository_store.set(iter_, [1, 2], ['?', 'Error'])
+            self.update_summary()
+            return
+
+        branch, status = result
+
+        self.repository_store.set(iter_, [1, 2], [branch, format_status(status)])
+
+        if any(status[key] for key in ['deleted', 'modified', 'new_file']):
+            self.dirty += 1
+
+        self.update_summary()
+
+    def update_summary(self):
+        text = f'{len(self.gits)} repositories, {self.dirty} with changes'
+        if self.done < len(self.gits):
+            text += f' ({len(self.gits) - self.done} pending)'
+
+        self.summary_label.set_text(text)
+
+    def destroyed(self, *_):
+        self.cancellable.cancel()
+
+        for git in self.gits:
+            release_git(git)
+
+        self.gits.clear()
+
+# vim: ft=python3 ts=4 et
@@ -21,11 +21,11 @@ import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk
 
-from utils import Git
+from .visibility import RepositoryView
 
 
 @Gtk.Template(resource_path='/org/mate/caja/extensions/git/ui/gitpropertypage.ui')
-class GitPropertyPage(Gtk.Grid):
+class GitPropertyPage(RepositoryView, Gtk.Grid):
     __gtype_name__ = 'GitPropertyPage'
 
     branch_label = Gtk.Template.Child()
@@ -36,21 +36,30 @@ class GitPropertyPage(Gtk.Grid):
     def __init__(self, path):
         super().__init__()
 
-        self.git = Git(path)
+        self.show_placeholder()
 
-        self.update_ui()
+        self.watch_repository(path)
 
-        self.git.connect('refresh', lambda _: self.refresh())
+    def show_placeholder(self, text='…'):
+        for prefix in ['branch', 'deleted', 'modified', 'new_file']:
+            getattr(self, f'{prefix}_label').set_text(text)
 
-    def update_ui(self):
-        self.branch_label.set_text(self.git.get_current_branch())
+    def query(self, cancellable):
+        return self.git.get_current_branch(cancellable), self.git.get_status(cancellable)
+
+    def query_snapshot(self, snapshot):
+        return snapshot.head, self.git.get_status(snapshot=snapshot)
+
+    def show_result(self, result):
+        branch, status = result
+
+        self.branch_label.set_text(branch)
 
-        status = self.git.get_status()
         for prefix in ['deleted', 'modified', 'new_file']:
             label = getattr(self, f'{prefix}_label')
-            label.set_text(str(len(status[prefix])))
+            label.set_text(f'{len(status[prefix])}+' if status['truncated'] else str(len(status[prefix])))
 
-    def refresh(self):
-        self.update_ui()
+    def show_error(self):
+        self.show_placeholder('?')
 
 # vim: ft=python3 ts=4 et
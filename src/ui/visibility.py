@@ -0,0 +1,184 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+__all__ = ['RepositoryView', 'VisibilityTracker']
+
+from concurrent.futures import ThreadPoolExecutor
+
+import gi
+
+gi.require_version('Gdk', '3.0')
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gdk, Gio, GObject, Gtk
+
+from tracing import traced, watch_main_loop
+from utils import acquire_git, release_git, run_async
+
+# Loads the statuses saved by previous sessions, apart from the queries so it does not wait behind them
+_cache_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='caja-git-cache')
+
+
+# Emits 'changed' when `widget` starts or stops being visible to the user, i.e. mapped (not in a background tab)
+# and in a window that is not minimised. Becomes invisible for good when the widget is destroyed.
+class VisibilityTracker(GObject.GObject):
+    __gsignals__ = {'changed': (GObject.SIGNAL_RUN_FIRST, None, (bool,))}
+
+    def __init__(self, widget):
+        super().__init__()
+
+        self.widget = widget
+        self.window = None
+        self.window_handler = 0
+        self.iconified = False
+        self.visible = False
+
+        self.handlers = [widget.connect('map', lambda _: self.update()),
+                         widget.connect('unmap', lambda _: self.update()),
+                         widget.connect('hierarchy-changed', lambda *_: self.toplevel_changed()),
+                         widget.connect('destroy', lambda _: self.destroyed())]
+
+        self.toplevel_changed()
+
+    def toplevel_changed(self):
+        if self.window is not None:
+            self.window.disconnect(self.window_handler)
+            self.window = None
+
+        if isinstance(toplevel := self.widget.get_toplevel(), Gtk.Window):
+            self.window = toplevel
+            self.window_handler = toplevel.connect('window-state-event', self.window_state_changed)
+
+            gdk_window = toplevel.get_window()
+            self.iconified = gdk_window is not None and bool(gdk_window.get_state() & Gdk.WindowState.ICONIFIED)
+        else:
+            self.iconified = False
+
+        self.update()
+
+    def window_state_changed(self, window, event):
+        self.iconified = bool(event.new_window_state & Gdk.WindowState.ICONIFIED)
+        self.update()
+
+        return False
+
+    def update(self, visible=None):
+        if visible is None:
+            visible = self.widget.get_mapped() and not self.iconified
+
+        if visible != self.visible:
+            self.visible = visible
+            self.emit('changed', visible)
+
+    def destroyed(self):
+        self.update(False)
+
+        if self.window is not None:
+            self.window.disconnect(self.window_handler)
+            self.window = None
+
+        for handler in self.handlers:
+            self.widget.disconnect(handler)
+
+        self.handlers.clear()
+
+
+# Keeps a widget showing the status of a repository up to date while it is visible, changes made while it is
+# hidden are picked up once it is shown again. The widget implements `query()` and `query_snapshot()`, which run in
+# a worker thread, `show_result()` and `show_error()`, and calls `watch_repository()` once it is built.
+class RepositoryView:
+    def watch_repository(self, path):
+        self.git = acquire_git(path)
+        self.git.revalidate()
+        self.cancellable = None
+        self.querying = False
+        self.shown = False
+        self.stale = False
+
+        watch_main_loop()
+
+        self.refresh()
+
+        run_async(self.query_cached, self.update_ui_cached, self.cancellable, _cache_executor)
+
+        self.refresh_handler = self.git.connect('refresh', lambda _: self.git_refreshed())
+
+        # Hidden tabs and closed windows neither watch the repository nor query it
+        self.visibility = VisibilityTracker(self)
+        self.visibility.connect('changed', self.visibility_changed)
+
+        self.connect('destroy', self.destroyed)
+
+    def query_cached(self, cancellable):
+        if (snapshot := self.git.get_cached_snapshot()) is None:
+            return None
+
+        return self.query_snapshot(snapshot)
+
+    @traced('ui')
+    def update_ui(self, result):
+        self.querying = False
+
+        # The previous status stays visible if git could not be run
+        if result is not None:
+            self.shown = True
+            self.show_result(result)
+        elif not self.shown:
+            self.show_error()
+
+    # The status saved by a previous session is shown until the current one is known, unless the query has
+    # already finished or failed
+    def update_ui_cached(self, result):
+        if result is not None and self.querying and not self.shown:
+            self.show_result(result)
+
+    @traced('ui')
+    def refresh(self):
+        # A newer refresh supersedes the one still in flight
+        if self.cancellable is not None:
+            self.cancellable.cancel()
+
+        self.cancellable = Gio.Cancellable.new()
+        self.querying = True
+        run_async(self.query, self.update_ui, self.cancellable)
+
+    def git_refreshed(self):
+        if self.visibility.visible:
+            self.refresh()
+        else:
+            self.stale = True
+
+    def visibility_changed(self, tracker, visible):
+        if visible:
+            self.git.resume()
+
+            if self.stale:
+                self.stale = False
+                self.refresh()
+        else:
+            self.git.suspend()
+
+            # A query still running is redone once visible again
+            if self.querying:
+                self.cancellable.cancel()
+                self.querying = False
+                self.stale = True
+
+    def destroyed(self, *_):
+        self.cancellable.cancel()
+        self.git.disconnect(self.refresh_handler)
+        release_git(self.git)
+
+# vim: ft=python3 ts=4 et
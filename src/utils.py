@@ -14,170 +14,557 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 #
 
-__all__ = ['Git', 'is_git_dir']
+__all__ = ['Git', 'acquire_git', 'is_git_dir', 'release_git', 'run_async']
 
+import logging
 import os
-import re
+import selectors
+import signal
 import subprocess
 import time
+from collections import namedtuple
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
-from shlex import quote
-from threading import Thread
+from threading import BoundedSemaphore, Lock
 
 import gi
 
-gi.require_version('Gtk', '3.0')
-from gi.repository import GLib, GObject, Gtk
+gi.require_version('Gio', '2.0')
+from gi.repository import Gio, GLib, GObject
 
-GIT_DIFF_NUMSTAT_RE = re.compile(r'(?P<added>\d+|-)\s+(?P<deleted>\d+|-)\s+.*')
+from config import read_config
+from diffcache import DiffCache
+from discovery import find_repository
+from remote import get_project_name, get_remote_url, get_web_url
+from refs import BranchIndex, get_common_dir, read_head, read_local_branches, uses_reftable
+from scheduler import RefreshScheduler
+from snapshotcache import get_cache_key, load_snapshot, store_snapshot
+from status import parse_numstat, parse_status
+from tracing import span
+from watcher import GitWatcher
 
-GIT_REMOTE_URL_SSH_RE = re.compile(r'^git@(.+?):')
-GIT_REMOTE_URL_SUFFIX_RE = re.compile(r'\.git$')
-GIT_REMOTE_URL_VALID_RE = re.compile(r'(https://|git@)')
+# Large repository mode defaults, see `Git.get_settings()`
+LARGE_REPO_INDEX_SIZE = 32 * 1024 * 1024
+LARGE_REPO_MAX_FILES = 10000
+LARGE_REPO_TIMEOUT = 10
 
-GIT_STATUS_DELETED_RE = re.compile(r'deleted:\s+(.*)')
-GIT_STATUS_MODIFIED_RE = re.compile(r'modified:\s+(.*)')
-GIT_STATUS_NEW_RE = re.compile(r'new file:\s+(.*)')
+# Values of caja-git.untracked, passed to `git status --untracked-files=`
+UNTRACKED_MODES = ('no', 'normal', 'all')
+
+# The `# branch.*` records `git status --porcelain=v2 --branch` starts with
+STATUS_HEADER_RECORDS = 4
+
+Settings = namedtuple('Settings', ['large_repo', 'max_files', 'timeout', 'untracked'])
+
+# Set for every git process on top of the inherited environment: untranslated output, and no index refreshes
+# that would take index.lock away from the user's own git commands
+GIT_ENV = {'LC_ALL': 'C', 'GIT_OPTIONAL_LOCKS': '0'}
+
+# Widgets opened within this many seconds of a status being started share it instead of running their own
+REVALIDATE_INTERVAL = 1
+
+# Bytes read from a git pipe at a time
+READ_SIZE = 64 * 1024
+
+# Background git commands running at the same time, across all repositories and widgets
+GIT_MAX_PROCESSES = max(2, min(8, os.cpu_count() or 1))
+
+# Shared engines keyed by the resolved top-level directory, see `acquire_git()`
+_registry = {}
+_registry_lock = Lock()
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='caja-git')
+
+_git_env = {**os.environ, **GIT_ENV}
+_git_semaphore = BoundedSemaphore(GIT_MAX_PROCESSES)
 
 
 def is_git_dir(path):
+    return find_repository(path) is not None
+
+
+def kill_process_group(proc):
     try:
-        subprocess.run('git rev-parse --is-inside-work-tree',
-                       stdout=subprocess.DEVNULL,
-                       stderr=subprocess.DEVNULL,
-                       shell=True,
-                       cwd=path,
-                       check=True)
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def decode_output(stdout, strip):
+    output = stdout.decode('utf-8', errors='surrogateescape')
+
+    return output.strip() if strip else output
+
+
+# ['-c', 'core.untrackedCache=true', 'status', '--porcelain=v2'] -> 'git status', so traces group by subcommand
+def get_command_name(args):
+    args = iter(args)
+    for arg in args:
+        if arg == '-c':
+            next(args, None)
+        elif not arg.startswith('-'):
+            return f'git {arg}'
+
+    return 'git'
+
+
+# Reads the output of `proc` until it exits. Once `timeout` runs out or `max_records` NUL terminated records have
+# been read, its process group is killed and the rest of what it wrote is read. Returns (stdout, stderr, stopped),
+# `stopped` being 'timeout', 'limit' or None.
+def read_output(proc, timeout=None, max_records=None):
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    output = {proc.stdout: bytearray(), proc.stderr: bytearray()}
+    records = 0
+    stopped = None
+
+    with selectors.DefaultSelector() as selector:
+        for pipe in output:
+            selector.register(pipe, selectors.EVENT_READ)
+
+        while selector.get_map():
+            wait = None
+            if stopped is None and deadline is not None:
+                if (wait := deadline - time.monotonic()) <= 0:
+                    stopped = 'timeout'
+                    kill_process_group(proc)
+                    wait = None
+
+            for key, _ in selector.select(wait):
+                if not (data := os.read(key.fd, READ_SIZE)):
+                    selector.unregister(key.fileobj)
+                    continue
+
+                output[key.fileobj] += data
+
+                if key.fileobj is proc.stdout and max_records is not None and stopped is None:
+                    if (records := records + data.count(b'\0')) >= max_records:
+                        stopped = 'limit'
+                        kill_process_group(proc)
 
+    proc.wait()
+
+    return bytes(output[proc.stdout]), bytes(output[proc.stderr]), stopped
+
+
+# Runs `git args...` in `path` without a shell and returns (stdout, stopped), see `read_output()`. Raises
+# subprocess.CalledProcessError carrying git's error message when git fails, so a failure is never mistaken for empty
+# output. Commands the user waits for pass `limit=False`, so they do not queue behind the background ones counted
+# against GIT_MAX_PROCESSES.
+def execute_git(args, path, cancellable=None, timeout=None, limit=True, max_records=None):
+    cmd = ['git', *args]
+
+    with _git_semaphore if limit else nullcontext():
+        if cancellable is not None and cancellable.is_cancelled():
+            raise CancelledError()
+
+        # A new session lets cancellation also kill whatever git spawned itself (hooks, fsmonitor, textconv)
+        with span('git', get_command_name(args), cmd=cmd, cwd=path) as trace_args, \
+                subprocess.Popen(cmd,
+                                 stdin=subprocess.DEVNULL,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE,
+                                 cwd=path,
+                                 env=_git_env,
+                                 start_new_session=True) as proc:
+            if cancellable is not None:
+                handler = cancellable.connect('cancelled', lambda _: kill_process_group(proc))
+                if cancellable.is_cancelled():
+                    kill_process_group(proc)
+
+            try:
+                stdout, stderr, stopped = read_output(proc, timeout, max_records)
+            finally:
+                if cancellable is not None:
+                    cancellable.disconnect(handler)
+
+            trace_args.update(exit_status=stopped or proc.returncode, output_bytes=len(stdout))
+
+            if cancellable is not None and cancellable.is_cancelled():
+                raise CancelledError()
+
+            if stopped is None and proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode, cmd, decode_output(stdout, False),
+                                                    decode_output(stderr, True))
+
+    return stdout, stopped
+
+
+# Like `execute_git()`, but raises subprocess.TimeoutExpired carrying the decoded output read so far when `timeout`
+# runs out
+def run_git(args, path, strip=True, cancellable=None, timeout=None, limit=True):
+    stdout, stopped = execute_git(args, path, cancellable, timeout, limit)
+    if stopped == 'timeout':
+        raise subprocess.TimeoutExpired(['git', *args], timeout, output=decode_output(stdout, strip))
+
+    return decode_output(stdout, strip)
+
+
+# For commands printing NUL terminated records, returns (output, truncated). Output stopped by `timeout` or
+# `max_records` only keeps the complete records read so far.
+def run_git_records(args, path, cancellable=None, timeout=None, max_records=None):
+    stdout, stopped = execute_git(args, path, cancellable, timeout, max_records=max_records)
+    if stopped is not None:
+        stdout = stdout[:stdout.rfind(b'\0') + 1]
+
+    return decode_output(stdout, False), stopped is not None
+
+
+def parse_bool(value, default=False):
+    if value is None:
+        return default
+
+    if (value := value.strip().lower()) in ('', 'true', 'yes', 'on', '1'):
         return True
-    except:
+
+    if value in ('false', 'no', 'off', '0'):
         return False
 
+    return default
 
-def do_shell(cmd, path):
-    proc = subprocess.run(cmd,
-                          stdout=subprocess.PIPE,
-                          stderr=subprocess.DEVNULL,
-                          shell=True,
-                          cwd=path)
-    return proc.stdout.decode('utf-8').strip()
 
+def parse_int(value, default=None):
+    if value is None:
+        return default
 
-def get_git_top_level_dir(path):
-    return do_shell('git rev-parse --show-toplevel', path)
+    # Git integers may carry a k, m or g suffix
+    multiplier = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}.get((value := value.strip().lower())[-1:], 1)
+    try:
+        return int(value[:-1] if multiplier > 1 else value) * multiplier
+    except ValueError:
+        return default
 
 
-def get_file_mtimes(path):
-    for dirname, subdirs, files in os.walk(path):
-        return [Path(dirname, file).stat().st_mtime for file in files]
+# Runs `func(cancellable)` on a worker thread (of `executor` if given) and passes its result to `callback` on the main
+# loop, nothing is delivered if `cancellable` gets cancelled or `func` raises
+def run_async(func, callback, cancellable=None, executor=None):
+    def deliver(result):
+        if cancellable is None or not cancellable.is_cancelled():
+            callback(result)
 
+        return False
 
-class Git(GObject.GObject, Thread):
-    __gsignals__ = {'refresh': (GObject.SIGNAL_RUN_FIRST, None, ())}
+    # A failed query still reaches `callback`, as None, so the caller can leave its loading state
+    def done(future):
+        try:
+            result = future.result()
+        except CancelledError:
+            return
+        except Exception:
+            logging.getLogger(__name__).exception('%s failed', getattr(func, '__qualname__', func))
+            result = None
+
+        GLib.idle_add(deliver, result)
 
-    def __init__(self, path):
-        GObject.GObject.__init__(self)
-        Thread.__init__(self)
+    def call():
+        if cancellable is not None and cancellable.is_cancelled():
+            raise CancelledError()
 
-        self.path = get_git_top_level_dir(path)
+        return func(cancellable)
 
-        self.daemon = True
-        self.to_watch = Path(self.path, '.git')
-        self.last_modified_time = None
+    (executor or _executor).submit(call).add_done_callback(done)
 
-        self.start()
 
-    def idle(self):
+def acquire_git(path):
+    if (repository := find_repository(path)) is None:
+        raise ValueError(f"'{path}' is not inside a git work tree")
+
+    with _registry_lock:
+        if (git := _registry.get(repository.top_level_dir)) is None:
+            git = _registry[repository.top_level_dir] = Git(*repository)
+
+        git.ref_count += 1
+
+    return git
+
+
+def release_git(git):
+    with _registry_lock:
+        git.ref_count -= 1
+        if git.ref_count > 0:
+            return
+
+        del _registry[git.path]
+
+    git.stop()
+
+
+class Git(GObject.GObject):
+    __gsignals__ = {'refresh': (GObject.SIGNAL_RUN_FIRST, None, ())}
+
+    # Use `acquire_git()` rather than creating instances directly
+    def __init__(self, path, git_dir):
+        super().__init__()
+
+        self.path = path
+        self.git_dir = Path(git_dir)
+        self.common_dir = get_common_dir(self.git_dir)
+        self.ref_count = 0
+        self.snapshot = None
+        self.snapshot_generation = 0
+        self.snapshot_lock = Lock()
+        self.snapshot_started = float('-inf')
+        self.stored_snapshot = None
+        self.numstats = None
+        self.config = None
+        self.remote = None
+        self.diff_cache = DiffCache()
+        self.ref_generation = 0
+        self.branch_index = None
+        self.active_count = 0
+
+        # Bursts of changes, e.g. from a rebase, are merged into one refresh
+        self.scheduler = RefreshScheduler(self.git_dir, self.common_dir)
+        self.scheduler.connect('refresh', lambda _: self.refresh())
+
+        # Only watched while one of the widgets using it is visible, see `resume()`
+        self.watcher = GitWatcher(self.git_dir, self.common_dir)
+        self.watcher.connect('changed', lambda _: self.scheduler.request())
+        self.watcher.pause()
+
+    def stop(self):
+        self.watcher.stop()
+        self.scheduler.stop()
+
+    # Called by widgets as they become visible, the repository is refreshed once if it changed while nobody watched
+    def resume(self):
+        self.active_count += 1
+        if self.active_count == 1:
+            self.watcher.resume()
+
+    def suspend(self):
+        self.active_count -= 1
+        if self.active_count == 0:
+            self.watcher.pause()
+
+    def invalidate(self):
+        self.snapshot = None
+        self.snapshot_generation += 1
+
+    # Called as widgets are opened, so they show the current status, while a burst of them opening on the same
+    # repository waits for the `git status` running or just started rather than discarding it
+    def revalidate(self):
+        if self.snapshot is None:
+            # Nothing to discard, a status may already be running for the widgets opened before
+            return
+
+        if time.monotonic() - self.snapshot_started >= REVALIDATE_INTERVAL:
+            self.invalidate()
+
+    def refresh(self):
+        self.invalidate()
+        self.ref_generation += 1
+
         self.emit('refresh')
 
-        return False
+    # Concurrent callers wait for the same `git status` instead of spawning their own
+    def get_snapshot(self, cancellable=None):
+        with self.snapshot_lock:
+            if (snapshot := self.snapshot) is None:
+                generation = self.snapshot_generation
+                self.snapshot_started = time.monotonic()
+                settings = self.get_settings(cancellable)
 
-    def run(self):
-        while self.to_watch.exists():
-            max_mtime = max(get_file_mtimes(self.to_watch))
-            if self.last_modified_time is not None and self.last_modified_time < max_mtime:
-                GLib.idle_add(self.idle)
+                args = ['status', '--porcelain=v2', '-z', '--branch']
+                if settings.untracked is not None:
+                    args.append(f'--untracked-files={settings.untracked}')
 
-            self.last_modified_time = max_mtime
+                if settings.large_repo:
+                    # core.fsmonitor is honoured as configured, the untracked cache only matters when scanning
+                    args = ['-c', 'core.untrackedCache=true', *args]
 
-            time.sleep(5)
+                # git is stopped once it has listed more than max_files entries, renames take two records each
+                max_records = None
+                if settings.max_files is not None:
+                    max_records = STATUS_HEADER_RECORDS + 2 * (settings.max_files + 1)
 
-    def get_current_branch(self):
-        if branch := do_shell('git branch --show-current', self.path):
-            return branch
+                # Taken before git status runs, so a change made while it runs makes the stored snapshot a miss
+                # instead of passing it off as current
+                key = get_cache_key(self.git_dir, self.common_dir)
 
-        return do_shell('git rev-parse HEAD', self.path)
+                output, truncated = run_git_records(args, self.path, cancellable, settings.timeout, max_records)
+                snapshot = parse_status(output, settings.max_files, truncated)
+                if generation == self.snapshot_generation:
+                    self.snapshot = snapshot
+                    self.prune_diff_cache(snapshot)
+                    self.store_snapshot(snapshot, key)
 
-    def get_diff(self, filename, staged):
-        return do_shell(f'git diff {"--cached" if staged else ""} {quote(filename)}', self.path)
+        return snapshot
 
-    def get_diffstat(self, filename, staged):
-        if diffstat := do_shell(f'git diff --numstat {"--cached" if staged else ""} {quote(filename)}', self.path):
-            if (match := GIT_DIFF_NUMSTAT_RE.search(diffstat)) is not None:
-                return f'{match.group("added")} insertions(+), {match.group("deleted")} deletions(-)'
+    # The snapshot saved by a previous session, if the repository still looks the same. It may not reflect
+    # changes to the work tree, so `get_snapshot()` has to follow.
+    def get_cached_snapshot(self):
+        key = get_cache_key(self.git_dir, self.common_dir)
+        if (snapshot := load_snapshot(self.path, key)) is not None:
+            self.stored_snapshot = (key, snapshot)
 
-        return None
+        return snapshot
 
-    def get_local_branches(self):
-        if branches := do_shell('git branch', self.path):
-            return sorted([b.lstrip('* ') for b in branches.splitlines()])
+    def store_snapshot(self, snapshot, key):
+        if self.stored_snapshot != (key, snapshot):
+            store_snapshot(self.path, key, snapshot)
+            self.stored_snapshot = (key, snapshot)
 
-        return []
+    def prune_diff_cache(self, snapshot):
+        entries = {e.path: e for e in snapshot.entries}
 
-    def get_modified(self):
-        modified = []
+        def is_valid(path, staged, identity):
+            return (entry := entries.get(path)) is not None and self.get_entry_diff_identity(entry, staged) == identity
 
-        if staged := do_shell('git diff --name-only --diff-filter=d --cached', self.path):
-            modified += [[f, 'S'] for f in staged.splitlines()]
+        self.diff_cache.retain(is_valid)
 
-        if unstaged := do_shell('git diff --name-only --diff-filter=d', self.path):
-            modified += [[f, 'U'] for f in unstaged.splitlines()]
+    # Identifies the content of a diff so cached copies can be reused, None if it should not be cached
+    def get_diff_identity(self, snapshot, filename, staged):
+        if (entry := next((e for e in snapshot.entries if e.path == filename), None)) is None:
+            return None
 
-        return sorted(modified)
+        return self.get_entry_diff_identity(entry, staged)
+
+    # Staged diffs are fully determined by the HEAD and index blobs, unstaged ones also depend on the work tree file
+    def get_entry_diff_identity(self, entry, staged):
+        if entry.conflicted:
+            return None
+
+        if staged:
+            return (entry.head_oid, entry.index_oid, entry.orig_path)
+
+        try:
+            st = Path(self.path, entry.path).stat()
+        except OSError:
+            return (entry.index_oid, None)
+
+        return (entry.index_oid, st.st_mtime_ns, st.st_size, st.st_ino)
+
+    # Loaded once per ref change generation, the watcher bumps it whenever refs may have changed
+    def get_branch_index(self, cancellable=None):
+        generation = self.ref_generation
+        if (branch_index := self.branch_index) is None or branch_index[0] != generation:
+            self.branch_index = branch_index = (generation, BranchIndex(self.get_local_branches(cancellable)))
+
+        return branch_index[1]
+
+    # Parsed in-process and re-read when one of the config files (includes too) changes
+    def get_config(self, cancellable=None):
+        if (config := self.config) is None or not config.is_fresh():
+            config = self.config = read_config(self.git_dir, self.common_dir)
 
-    def get_project_name(self):
-        if (url := self.get_remote_url()) is None:
-            return Path(self.path).name
+        return config
+
+    # Large repository mode is enabled with caja-git.largeRepo, or automatically ('auto', the default)
+    # once the index grows past caja-git.largeRepoIndexSize bytes
+    def get_settings(self, cancellable=None):
+        config = self.get_config(cancellable)
+
+        # A key without a value is a boolean true
+        if (large_repo := (config.get('caja-git.largerepo', 'auto') or 'true').strip().lower()) == 'auto':
+            try:
+                index_size = (self.git_dir / 'index').stat().st_size
+            except OSError:
+                index_size = 0
+
+            large_repo = index_size >= parse_int(config.get('caja-git.largerepoindexsize'), LARGE_REPO_INDEX_SIZE)
+        else:
+            large_repo = parse_bool(large_repo)
+
+        max_files = parse_int(config.get('caja-git.maxfiles'), LARGE_REPO_MAX_FILES if large_repo else None)
+        timeout = parse_int(config.get('caja-git.timeout'), LARGE_REPO_TIMEOUT if large_repo else None)
+
+        # Anything git status would reject falls back to the default instead of failing every refresh, None keeps
+        # git's own status.showUntrackedFiles
+        if (untracked := (config.get('caja-git.untracked') or '').strip().lower()) not in UNTRACKED_MODES:
+            untracked = 'no' if large_repo else None
+
+        return Settings(large_repo, max_files or None, timeout or None, untracked)
+
+    def get_current_branch(self, cancellable=None):
+        if not uses_reftable(self.common_dir) and (head := read_head(self.git_dir)) is not None:
+            return head
+
+        return self.get_snapshot(cancellable).head
+
+    def get_diff(self, filename, staged, cancellable=None):
+        return run_git(['diff', *(['--cached'] if staged else []), '--', filename], self.path, cancellable=cancellable)
+
+    # Returns a Gio.Subprocess whose stdout pipe streams the diff
+    def spawn_diff(self, filename, staged):
+        launcher = Gio.SubprocessLauncher.new(Gio.SubprocessFlags.STDOUT_PIPE | Gio.SubprocessFlags.STDERR_SILENCE)
+        launcher.set_cwd(self.path)
+        for name, value in GIT_ENV.items():
+            launcher.setenv(name, value, True)
+
+        return launcher.spawnv(['git', 'diff', *(['--cached'] if staged else []), '--', filename])
+
+    # Line counts of every staged ('S') and unstaged ('U') file, computed once per status snapshot
+    def get_numstats(self, cancellable=None):
+        snapshot = self.get_snapshot(cancellable)
+        if (numstats := self.numstats) is None or numstats[0] is not snapshot:
+            timeout = self.get_settings(cancellable).timeout
+            numstats = self.numstats = (snapshot, {
+                'S': parse_numstat(run_git_records(['diff', '--numstat', '-z', '--cached'], self.path, cancellable,
+                                                   timeout)[0]),
+                'U': parse_numstat(run_git_records(['diff', '--numstat', '-z'], self.path, cancellable, timeout)[0])
+            })
+
+        return numstats[1]
+
+    def get_local_branches(self, cancellable=None):
+        if not uses_reftable(self.common_dir):
+            return read_local_branches(self.common_dir)
+
+        branches = run_git(['for-each-ref', '--format=%(refname:strip=2)%00', 'refs/heads/'],
+                           self.path,
+                           strip=False,
+                           cancellable=cancellable)
+
+        return sorted(b.strip('\n') for b in branches.split('\0') if b.strip('\n'))
+
+    def get_modified(self, cancellable=None, snapshot=None):
+        if snapshot is None:
+            snapshot = self.get_snapshot(cancellable)
+
+        modified = [[e.path, 'S'] for e in snapshot.staged if e.index != 'D']
+        modified += [[e.path, 'U'] for e in snapshot.unstaged if e.worktree != 'D']
+        modified += [[e.path, 'U'] for e in snapshot.conflicted]
+
+        return sorted(modified)
 
-        return Path(url).stem
+    # (clone URL, web URL, project name), computed once per config change
+    def get_remote(self, cancellable=None):
+        config = self.get_config(cancellable)
+        if (remote := self.remote) is None or remote[0] is not config:
+            url = get_remote_url(config)
+            name = get_project_name(url) if url is not None else None
 
-    def get_remote_url(self):
-        def normalize_url(url):
-            if url.startswith('git@'):
-                url = GIT_REMOTE_URL_SSH_RE.sub('https://\1/', url)
+            remote = self.remote = (config, (url, get_web_url(url) if url is not None else None,
+                                             name or Path(self.path).name))
 
-            return GIT_REMOTE_URL_SUFFIX_RE.sub('', url)
+        return remote[1]
 
-        if url := do_shell('git config --get remote.origin.url', self.path):
-            if GIT_REMOTE_URL_VALID_RE.match(url) is not None:
-                return normalize_url(url)
+    def get_project_name(self, cancellable=None):
+        return self.get_remote(cancellable)[2]
 
-        return None
+    # The web page of the project, if the remote is hosted somewhere it can be derived from
+    def get_remote_url(self, cancellable=None):
+        return self.get_remote(cancellable)[1]
 
-    def get_status(self):
-        status = do_shell('git status', self.path)
-        deleted = GIT_STATUS_DELETED_RE.findall(status)
-        modified = GIT_STATUS_MODIFIED_RE.findall(status)
-        new_file = GIT_STATUS_NEW_RE.findall(status)
+    def get_status(self, cancellable=None, snapshot=None):
+        if snapshot is None:
+            snapshot = self.get_snapshot(cancellable)
 
         return {
-            'deleted': sorted(set(deleted)),
-            'modified': sorted(set(modified)),
-            'new_file': sorted(set(new_file))
+            'deleted': sorted(e.path for e in snapshot.deleted),
+            'modified': sorted(e.path for e in snapshot.entries if 'M' in (e.index, e.worktree)),
+            'new_file': sorted(e.path for e in snapshot.staged if e.index == 'A'),
+            'truncated': snapshot.truncated
         }
 
-    def switch_branch(self, branch, dialog_):
-        if branch in self.get_local_branches():
-            do_shell(f'git checkout {branch}', self.path)
+    # Raises subprocess.CalledProcessError with git's message if the checkout fails, e.g. because local changes
+    # would be overwritten. Not bound by the process limit, the user is waiting for it.
+    def switch_branch(self, branch, create=False, cancellable=None):
+        if create:
+            run_git(['checkout', '-b', branch], self.path, cancellable=cancellable, limit=False)
         else:
-            dialog = Gtk.MessageDialog(transient_for=dialog_,
-                                       flags=0,
-                                       message_type=Gtk.MessageType.QUESTION,
-                                       buttons=Gtk.ButtonsType.YES_NO,
-                                       text=f"The '{branch}' branch does not exist. Do you want to create it?")
-            if dialog.run() == Gtk.ResponseType.YES:
-                do_shell(f'git checkout -b {branch}', self.path)
-
-            dialog.destroy()
+            # The trailing '--' keeps a file with the same name from being checked out instead
+            run_git(['checkout', branch, '--'], self.path, cancellable=cancellable, limit=False)
 
 # vim: ft=python3 ts=4 et
@@ -0,0 +1,182 @@
+# Copyright (C) 2021 Filip Szymański <fszymanski.pl@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+#
+
+__all__ = ['GitWatcher']
+
+import os
+from pathlib import Path
+
+import gi
+
+gi.require_version('Gio', '2.0')
+from gi.repository import Gio, GLib, GObject
+
+WATCH_DEBOUNCE_MS = 50
+WATCH_COMMON_FILES = ('packed-refs',)
+WATCH_FILES = ('HEAD', 'index')
+WATCH_POLL_INTERVAL = 5
+
+
+def get_file_mtime(path):
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+class GitWatcher(GObject.GObject):
+    __gsignals__ = {'changed': (GObject.SIGNAL_RUN_FIRST, None, ())}
+
+    # `common_dir` differs from `git_dir` in linked worktrees, which share refs with the main repository
+    def __init__(self, git_dir, common_dir=None):
+        super().__init__()
+
+        self.git_dir = Path(git_dir)
+        self.common_dir = self.git_dir if common_dir is None else Path(common_dir)
+        self.refs_dir = self.common_dir / 'refs'
+
+        self.monitors = {}
+        self.debounce_id = 0
+        self.poll_id = 0
+        self.last_mtimes = None
+        self.paused_stamp = None
+
+    def start(self):
+        try:
+            self.watch_dir(self.git_dir)
+            self.watch_dir(self.common_dir)
+            for dirname, _, _ in os.walk(self.refs_dir):
+                self.watch_dir(Path(dirname))
+        except GLib.Error:
+            self.start_polling()
+            return
+
+        # GIO silently falls back to polling when the kernel cannot notify us (e.g. some network filesystems),
+        # our own mtime poll is cheaper because it only looks at the files we care about
+        if any(m.__gtype__.name == 'GPollFileMonitor' for m in self.monitors.values()):
+            self.start_polling()
+
+    def stop(self):
+        for monitor in self.monitors.values():
+            monitor.cancel()
+
+        self.monitors.clear()
+
+        if self.debounce_id:
+            GLib.source_remove(self.debounce_id)
+            self.debounce_id = 0
+
+        if self.poll_id:
+            GLib.source_remove(self.poll_id)
+            self.poll_id = 0
+
+    # Stops watching but remembers enough to tell on `resume()` whether anything changed in the meantime
+    def pause(self):
+        self.stop()
+
+        self.paused_stamp = self.get_stamp()
+
+    def resume(self):
+        self.start()
+
+        if self.paused_stamp is not None and self.get_stamp() != self.paused_stamp:
+            self.emit('changed')
+
+        self.paused_stamp = None
+
+    def watch_dir(self, path):
+        if path in self.monitors:
+            return
+
+        monitor = Gio.File.new_for_path(str(path)).monitor_directory(Gio.FileMonitorFlags.NONE, None)
+        monitor.connect('changed', self.monitor_changed)
+
+        self.monitors[path] = monitor
+
+    def is_relevant(self, path):
+        if path.name.endswith('.lock'):
+            return False
+
+        if path.parent == self.git_dir and path.name in WATCH_FILES:
+            return True
+
+        if path.parent == self.common_dir and path.name in WATCH_COMMON_FILES:
+            return True
+
+        return path == self.refs_dir or self.refs_dir in path.parents
+
+    def monitor_changed(self, monitor, file, other_file, event_type):
+        if event_type == Gio.FileMonitorEvent.ATTRIBUTE_CHANGED:
+            return
+
+        path = Path(file.get_path())
+        if not self.is_relevant(path):
+            return
+
+        if event_type == Gio.FileMonitorEvent.CREATED and path.is_dir():
+            try:
+                for dirname, _, _ in os.walk(path):
+                    self.watch_dir(Path(dirname))
+            except GLib.Error:
+                pass
+        elif event_type == Gio.FileMonitorEvent.DELETED and (monitor_ := self.monitors.pop(path, None)) is not None:
+            monitor_.cancel()
+
+        if self.debounce_id:
+            GLib.source_remove(self.debounce_id)
+
+        self.debounce_id = GLib.timeout_add(WATCH_DEBOUNCE_MS, self.debounced)
+
+    def debounced(self):
+        self.debounce_id = 0
+
+        self.emit('changed')
+
+        return False
+
+    def get_mtimes(self):
+        mtimes = {self.git_dir / name: get_file_mtime(self.git_dir / name) for name in WATCH_FILES}
+        mtimes.update((self.common_dir / name, get_file_mtime(self.common_dir / name)) for name in WATCH_COMMON_FILES)
+        for dirname, _, files in os.walk(self.refs_dir):
+            mtimes.update((Path(dirname, file), get_file_mtime(Path(dirname, file))) for file in files)
+
+        return mtimes
+
+    # Cheaper than `get_mtimes()` with many loose refs, git updates refs by renaming a lock file over them
+    # so their directory mtime changes as well
+    def get_stamp(self):
+        stamp = [get_file_mtime(self.git_dir / name) for name in WATCH_FILES]
+        stamp += [get_file_mtime(self.common_dir / name) for name in WATCH_COMMON_FILES]
+        for dirname, _, _ in os.walk(self.refs_dir):
+            stamp.append((dirname, get_file_mtime(Path(dirname))))
+
+        return stamp
+
+    def start_polling(self):
+        self.stop()
+
+        self.last_mtimes = self.get_mtimes()
+        self.poll_id = GLib.timeout_add_seconds(WATCH_POLL_INTERVAL, self.poll)
+
+    def poll(self):
+        if (mtimes := self.get_mtimes()) != self.last_mtimes:
+            self.last_mtimes = mtimes
+
+            self.emit('changed')
+
+        return True
+
+# vim: ft=python3 ts=4 et